@@ -1,619 +1,2888 @@
-import osmnx as ox
 import pandas as pd
-import geopandas as gpd
-import random
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy import stats
 import shutil
+import concurrent.futures
+import contextlib
+import functools
 import glob
+import hashlib
+import json
+import logging
 import os
-import requests
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# --- Run metrics ---
+def _peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
 
-def tephra_cleanup_volume_from_place (place, min_thickness, max_thickness, fig, csv):
+def _reset_peak_rss():
+    # Linux resets the peak resident memory of the process (and so ru_maxrss) when 5 is written to clear_refs.
+    # Returns whether the peak could be reset
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class RunMetrics:
     """
-    This function will estimate the volume of tephra requiring removal as part of municipal clean-up efforts.
-    The function requires the name of the place and the thickness of tephra in mm. The user can specifiy whether a
-    graph and csv file is produced with the model results.
+    Collects the wall time, peak resident memory, feature counts and bytes read and written of each stage of a clean-up
+    run, and the number of OSM requests that were retried. The peak resident memory of each stage is the peak of the
+    run up to the end of that stage. On Linux the peak is reset when a clean-up function starts, so it only covers
+    that run (runs in several threads of one process share it). Elsewhere it is the peak of the whole process so far
+    (ru_maxrss), which in a worker process can come from an earlier task; peak_rss_reset tells the two apart.
 
         Arguments:
-            place (str): Name of the place for OSMnX to search the OSM database and collect the exposure data
-            thickness (float): Thickness of tephra in mm to model across the urban area of interest
-            fig (Bool): Defines whether a graph is produced and saved of the model results (True) or not (False)
-            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            callback (function): Called with the record (dict) of each stage as soon as the stage finishes, e.g. to
+            send run telemetry to a dashboard. Defaults to None
+    """
+    def __init__(self, callback=None):
+        self.stages = []
+        self.retries = 0
+        self.callback = callback
+        self.peak_rss_reset = False
+
+    def __getstate__(self):
+        # Callbacks are often closures which cannot be sent back from worker processes
+        state = self.__dict__.copy()
+        state["callback"] = None
+        return state
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {"stage": name, "features": None, "bytes_read": 0, "bytes_written": 0}
+        start = time.perf_counter()
+        yield record
+        record["wall_time"] = time.perf_counter() - start
+        record["peak_rss"] = _peak_rss()
+        self.stages.append(record)
+        logger.debug("Stage %s finished in %.3f s", name, record["wall_time"])
+        if self.callback is not None:
+            self.callback(record)
+
+    @property
+    def wall_time(self):
+        return sum(record["wall_time"] for record in self.stages)
+
+    @property
+    def peak_rss(self):
+        peaks = [record["peak_rss"] for record in self.stages if record["peak_rss"] is not None]
+        return max(peaks) if peaks else None
+
+    def to_frame(self):
+        """
+        Returns:
+             Stages (DataFrame): One row per stage with its wall time (s), peak RSS (bytes), feature count and bytes
+             read and written
+        """
+        return pd.DataFrame(self.stages, columns=["stage", "wall_time", "peak_rss", "features", "bytes_read",
+                                                  "bytes_written"])
+
+    def __repr__(self):
+        return "RunMetrics(stages={}, wall_time={:.3f}s, peak_rss={}, retries={})".format(
+            len(self.stages), self.wall_time, self.peak_rss, self.retries)
+
+
+_active_metrics = threading.local()
+
+
+@contextlib.contextmanager
+def _collect_metrics(metrics):
+    previous = getattr(_active_metrics, "metrics", None)
+    _active_metrics.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _active_metrics.metrics = previous
+
+
+def _stage(name):
+    metrics = getattr(_active_metrics, "metrics", None)
+    if metrics is None:
+        return contextlib.nullcontext({})
+    return metrics.stage(name)
+
+
+def _record_retry():
+    metrics = getattr(_active_metrics, "metrics", None)
+    if metrics is not None:
+        metrics.retries += 1
+
+
+def _instrumented(function):
+    # Runs a clean-up function with a RunMetrics collecting its stages and attaches the metrics to its result
+    @functools.wraps(function)
+    def wrapper(*args, callback=None, **kwargs):
+        metrics = RunMetrics(callback)
+        metrics.peak_rss_reset = _reset_peak_rss()
+        with _collect_metrics(metrics):
+            result = function(*args, **kwargs)
+        result.metrics = metrics
+        if metrics.peak_rss is not None:
+            logger.info("Peak memory of %s: %.0f MB", function.__name__, metrics.peak_rss / 1e6)
+        return result
+    return wrapper
+
+
+def draw_uniform_samples(low, high, N=10000, seed=None):
+    """
+    Draws N samples from each of several uniform distributions in a single batched call to a NumPy Generator.
+    This is the shared Monte Carlo engine used by the clean-up functions.
+
+        Arguments:
+            low (list): Lower bound of each uniform distribution
+            high (list): Upper bound of each uniform distribution
+            N (int): Number of samples to draw from each distribution
+            seed (int): Seed (or numpy Generator/SeedSequence) for reproducible sampling. Defaults to None
         Returns:
-             Volume (Dict): Returns a Dictionary of model results at the 5th, 50th, and 95th percentile for the volume
-             of tephra removal required in cubic metres
+             Samples (ndarray): Array of shape (len(low), N) with one row of samples per distribution
     """
-    ox.config(timeout=2000)
-    print("Initiating tephra clean-up model for ", place)
-    substring = ","
-    if place.find(substring) != -1:
-        place_name_initial = place[:place.index(",")]
-        place_name = place_name_initial.replace(" ", "")
-        place_name_save = place_name.replace(" ", "_")
-    else:
-        place_name = place
-        place_name_save = place_name.replace(" ", "_")
-    directory = os.path.dirname(os.path.abspath(__file__))
-    Geospatial_dir = directory + "/Geospatial_data/" + place_name_save
-    if not os.path.exists(Geospatial_dir):
-        os.makedirs(Geospatial_dir)
-        print("Geospatial folder has been created")
-    else:
-        print("Geospatial folder already exists")
+    rng = np.random.default_rng(seed)
+    low = np.asarray(low, dtype=float)[:, np.newaxis]
+    high = np.asarray(high, dtype=float)[:, np.newaxis]
+    return rng.uniform(low, high, size=(low.shape[0], int(N)))
+
+
+SAMPLING_METHODS = ("monte_carlo", "sobol", "analytic")
+MAX_QUANTILE_ITERATIONS = 60
+
+
+def _uniform_bounds(low, high):
+    # Broadcasts the bounds of each uniform distribution against each other, with a trailing axis for the samples
+    bounds = np.broadcast_arrays(*[np.asarray(bound, dtype=float) for bound in list(low) + list(high)])
+    return [bound[..., np.newaxis] for bound in bounds[:len(low)]], [bound[..., np.newaxis] for bound in
+                                                                      bounds[len(low):]]
+
 
-    print("Obtaining building footprints from OSM.")
-    for attempt in range(10):
+def uniform_product_quantile(low, high, q):
+    """
+    Calculates the exact quantiles of a single uniform distribution, or of the product of two independent, non-negative
+    uniform distributions such as the clean-up area and the tephra thickness. The cumulative distribution function of
+    the product has a closed form, which is inverted by safeguarded Newton iterations for all scenarios and
+    quantiles at once.
+
+        Arguments:
+            low (list): Lower bound of one or two uniform distributions. Each bound may be an array of many scenarios
+            high (list): Upper bound of each uniform distribution
+            q (float or ndarray): Probabilities between 0 and 1, e.g. [0.1, 0.5, 0.9]
+        Returns:
+             Quantiles (ndarray): Array of shape (scenarios..., len(q)) with the quantiles of the product
+    """
+    (a, *rest_low), (b, *rest_high) = _uniform_bounds(low, high)
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    if not rest_low:
+        return a + q * (b - a)
+    c, d = rest_low[0], rest_high[0]
+    if len(rest_low) > 1:
+        raise ValueError("uniform_product_quantile supports the product of at most two uniform distributions")
+    wx, wy = b - a, d - c
+    degenerate = (wx <= 0) | (wy <= 0)
+    # Replacing the bounds of degenerate distributions keeps the iterations free of divisions by zero
+    a0, b0, c0, d0 = [np.where(degenerate, value, bound) for value, bound in ((1, a), (2, b), (1, c), (2, d))]
+    inv_c = np.divide(1, c0, out=np.full(c0.shape, np.inf), where=c0 > 0)
+    inv_d = 1 / d0
+    scale = 1 / ((b0 - a0) * (d0 - c0))
+    lower = np.broadcast_to(a0 * c0, np.broadcast(a0, q).shape).copy()
+    upper = np.broadcast_to(b0 * d0, lower.shape).copy()
+    z = (lower + upper) / 2
+    # Newton steps on the cumulative distribution function, falling back to bisection whenever a step would leave
+    # the bracket around the quantile
+    for _ in range(MAX_QUANTILE_ITERATIONS):
+        x1 = np.clip(z * inv_d, a0, b0)
+        x2 = np.clip(z * inv_c, a0, b0)
+        log_ratio = np.log(x2 / x1)
+        error = ((d0 - c0) * (x1 - a0) + z * log_ratio - c0 * (x2 - x1)) * scale - q
+        lower = np.where(error <= 0, z, lower)
+        upper = np.where(error >= 0, z, upper)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = z - error / (log_ratio * scale)
+        bisect = ~((step >= lower) & (step <= upper))
+        previous, z = z, np.where(bisect, (lower + upper) / 2, step)
+        if np.all(np.abs(z - previous) <= 1e-12 * upper):
+            break
+    z = np.where(q <= 0, a * c, np.where(q >= 1, b * d, z))
+    return np.where(degenerate, (a + q * (b - a)) * (c + q * (d - c)), z)
+
+
+def sample_uniform_product(low, high, N=10000, seed=None, sampling="monte_carlo"):
+    """
+    Samples the product of independent uniform distributions, e.g. the clean-up area and the tephra thickness, for
+    one or many scenarios.
+
+        Arguments:
+            low (list): Lower bound of each uniform distribution. Each bound may be an array of many scenarios
+            high (list): Upper bound of each uniform distribution
+            N (int): Number of samples to draw for each scenario
+            seed (int): Seed (or numpy Generator) for the random number generator. Defaults to None
+            sampling (str): "monte_carlo" draws pseudo-random samples. "sobol" draws a scrambled Sobol sequence
+            (requires SciPy), which gives stable percentiles with far fewer samples; N is rounded up to a power of
+            two. "analytic" returns the exact quantiles of the product at N evenly spaced probabilities
+        Returns:
+             Samples (ndarray): Array of shape (scenarios..., N) with the samples of the product
+    """
+    if sampling == "analytic":
+        return uniform_product_quantile(low, high, (np.arange(int(N)) + 0.5) / int(N))
+    low, high = _uniform_bounds(low, high)
+    if sampling == "monte_carlo":
+        shape = low[0].shape[:-1]
+        Samples = draw_uniform_samples(np.concatenate([bound.ravel() for bound in low]),
+                                       np.concatenate([bound.ravel() for bound in high]), N=N, seed=seed)
+        return np.prod(Samples.reshape((len(low),) + shape + (int(N),)), axis=0)
+    elif sampling == "sobol":
         try:
-            try:
-                buildings = ox.geometries_from_place(place, tags={"building": True}, which_result=None,
-                                                     buffer_dist=None)
-                break
-            except (TypeError, ValueError, KeyError):
-                print("OSMnX may not be able to find place. "
-                      "Try using the tephra_cleanup_from_address function instead")
-                exit()
-
-        except requests.exceptions.ReadTimeout:
-            print("Timeout")
-    print("Reprojecting buildings to UTM")
-    FP_area_UTM = ox.projection.project_gdf(buildings, to_crs=None, to_latlong=False)
-    print("Calculating footprint area.")
-    FP_area_UTM["area"] = FP_area_UTM['geometry'].area
-    fp_area = FP_area_UTM['area'].sum()
-    print("Saving building footprints to disk")
-    print("Total building footprint area is: ", fp_area)
-    FP_area_UTM[['area', 'geometry']].to_file(
-        "Geospatial_data/" + place_name_save + "/" + place_name_save + "_buildings.gpkg", driver="GPKG",
-        encoding='UTF-8')
-
-    print("Building footprints obtained, now obtaining roads from OSM.")
-    try:
-        roads = ox.graph_from_place(place, network_type='drive')
-    except (TypeError, ValueError, KeyError):
-        print(
-            "OSMnX may not be able to find location using from_place. "
-            "Try using the tephra_cleanup_from_address instead")
-        exit()
-    print("reprojecting roads to UTM")
-    road_UTM = ox.project_graph(roads)
-    print("saving roads locally")
-    ox.io.save_graph_geopackage(road_UTM,
-                                "Geospatial_data/" + place_name_save + "/" + place_name_save + "_roads.gpkg",
-                                encoding='UTF-8')
-    print("Roads save locally")
-    road_UTM = gpd.read_file("Geospatial_data/" + place_name_save + "/" + place_name_save + "_roads.gpkg",
-                                       layer='edges')
-
-    print("Estimating road area")
-    road_UTM["area"] = road_UTM["length"] * 3
-    road_area = road_UTM['area'].sum()
-    print("Estimating impervious surface area based on road area")
-    impervious_area = road_area
-    print("Estimating building footprint area")
-    fp_area = FP_area_UTM['area'].sum()
-    #roads["area"] = roads["length"] * 3
-    all_area = road_area + fp_area + impervious_area
-
-    # Tephra thickness
-    #Tephra_thicknesses = tephra_thickness
-    # Tephra_thicknesses.fillna(0, inplace=True)
-    # Study_area_thicknesses = Tephra_thicknesses[Tephra_thicknesses['City'] == Study_area]
-    # Study_area_thicknesses_transpose = Study_area_thicknesses.set_index('City').T
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError("SciPy is required for sampling='sobol'")
+        points = qmc.Sobol(d=len(low), scramble=True, seed=np.random.default_rng(seed)).random_base2(
+            int(np.ceil(np.log2(max(int(N), 1)))))
+        return np.prod([lo + points[:, i] * (hi - lo) for i, (lo, hi) in enumerate(zip(low, high))], axis=0)
+    raise ValueError("sampling must be one of " + ", ".join(SAMPLING_METHODS))
 
-    # ---------- Cleanup model thresholds ----------
-    #Scenario = i
-    print("Initiating clean-up modelling for", place)
-    #max_thickness = row[Study_area]
-    #Min_Model_Thickness = row[Study_area] / 2
-    print("Maximum tephra thickness for", place, "is:", max_thickness, "mm. Minimum  thickness is:",
-          min_thickness)
-    #####
-    #####
-    # Clean-up thresholds
-    print("Determining the appropriate clean-up threshold to use.")
-    if max_thickness >= 1000:
-        cleanup_area_min = all_area - (all_area * 0.1)
-        cleanup_area_max = all_area + (all_area * 0.1)
-    elif max_thickness >= 10:
-        cleanup_area_min = (road_area - (road_area * 0.1)) + (impervious_area - (impervious_area * 0.1)) + (
-                fp_area - (fp_area * 0.1))
-        cleanup_area_max = (road_area + (road_area * 0.1)) + (impervious_area + (impervious_area * 0.1)) + (
-                fp_area + (fp_area * 0.1))
-    # elif Model_Thickness >= 10:
-    #     cleanup_area_min = road_area - (road_area * 0.1)
-    #     cleanup_area_max = road_area + (road_area * 0.1)
-    elif max_thickness >= 0.5:
-        cleanup_area_min = road_area - (road_area * 0.1)
-        cleanup_area_max = road_area + (road_area * 0.1)
-    elif max_thickness < 0.5:
-        cleanup_area_min = 0
-        cleanup_area_max = 0
 
-    # --- Monte Carlo analysis ---
-    Thickness = []
-    Area = []
-    Volume = []
-    # Dollars=[]
-    # Duration=[]
-
-    N = 10000
-    print("Calculating tephra volume requiring clean-up.")
-    for i in range(N):
-        DThickness = ((random.uniform((min_thickness), (max_thickness)) / 1000))
-        DArea = (random.uniform((cleanup_area_min), (cleanup_area_max)))
-        DVolume = (DArea * DThickness)
-        # DDollars =((random.randint(Min_cost_per_m3, Max_cost_per_m3)*DVolume)/1000)
-        # DDuration =((DVolume/(random.randint(Min_truck_size_m3, Max_truck_size_m3)))*
-        # (random.randint(Min_disposal_time_mins,Max_disposal_time_mins)/(random.randint(Min_trucks, Max_trucks)))/
-        # (random.randint(Min_hrs_day, Max_hrs_day)*60))
-
-        Thickness = Thickness + [DThickness]
-        Area = Area + [DArea]
-        Volume = Volume + [DVolume]
-        # Dollars=Dollars+[DDollars]
-        # Duration=Duration+[DDuration]
-
-    num_bins = 50
-
-    df = pd.DataFrame(Volume)
-    print(df.describe())
-
-    Percentile_50 = stats.scoreatpercentile(Volume, 50)
-    Percentile_10 = stats.scoreatpercentile(Volume, 10)
-    Percentile_90 = stats.scoreatpercentile(Volume, 90)
-    CleanUpVolume = pd.DataFrame([[place, Percentile_10, Percentile_50, Percentile_90]],
-                                 columns=["Place",
-                                          "10th Percentile",
-                                          "50th Percentile",
-                                          "90th Percentile"])
-    print(CleanUpVolume)
-    if csv==True:
-        path_csv = "Results/" + place + "_" + ".csv"
-        CleanUpVolume.to_csv(path_csv, index=False)
-        path_temp = "Results/temp/" + place_name_save + "_" + ".csv"
-        CleanUpVolume.to_csv(path_temp, index=False)
+def percentile_convergence(Volume, steps=5):
+    """
+    Shows how the 10th, 50th and 90th percentiles settle as more samples are used, from Volume[:N / 2 ** (steps - 1)]
+    up to all N samples.
+
+        Arguments:
+            Volume (ndarray): Samples of the clean-up volume
+            steps (int): Number of sample sizes to compare
+        Returns:
+             Convergence (DataFrame): Percentiles for each number of samples, and the largest relative change of
+             the three percentiles from the previous number of samples
+    """
+    Volume = np.asarray(Volume)
+    sizes = [size for size in (len(Volume) >> step for step in range(steps - 1, -1, -1)) if size > 0]
+    Convergence = pd.DataFrame([np.percentile(Volume[:size], [10, 50, 90]) for size in sizes], columns=[10, 50, 90],
+                               dtype=float)
+    Convergence.insert(0, "samples", sizes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Convergence["change"] = (Convergence[[10, 50, 90]].diff().abs() / Convergence[[10, 50, 90]]).max(axis=1)
+    return Convergence
+
+
+CLEANUP_RESOURCES = ("cost_per_m3", "truck_size_m3", "disposal_time_mins", "trucks", "hrs_day")
+
+
+def sample_resource(distribution, size, seed=None):
+    """
+    Draws samples of one clean-up resource parameter.
+
+        Arguments:
+            distribution (float, tuple or function): A fixed value, a (min, max) tuple for a uniform distribution,
+            or a function taking a numpy Generator and the sample shape, e.g. lambda rng, size: rng.normal(8, 1, size)
+            size (int or tuple): Shape of the samples
+            seed (int): Seed (or numpy Generator) for the random number generator. Defaults to None
+        Returns:
+             Samples (ndarray): Samples of the parameter
+    """
+    rng = np.random.default_rng(seed)
+    if callable(distribution):
+        return np.asarray(distribution(rng, size), dtype=float)
+    if np.ndim(distribution) == 0:
+        return np.full(size, distribution, dtype=float)
+    low, high = distribution
+    return rng.uniform(low, high, size=size)
+
+
+def cleanup_cost_duration(Volume, resources, seed=None):
+    """
+    Samples the cost and duration of clean-up jointly with the sampled clean-up volume. Each volume sample is paired
+    with one sample of every resource parameter, so the whole calculation is a handful of array operations however
+    many samples are drawn.
+
+        Arguments:
+            Volume (ndarray): Monte Carlo samples of the clean-up volume in cubic metres, of any shape
+            resources (dict): Distribution of each parameter in CLEANUP_RESOURCES, see sample_resource:
+            "cost_per_m3" (cost of removing and disposing of one cubic metre of tephra),
+            "truck_size_m3" (capacity of one truck in cubic metres),
+            "disposal_time_mins" (round trip to the disposal site in minutes),
+            "trucks" (number of trucks working) and
+            "hrs_day" (working hours per day)
+            seed (int): Seed (or numpy Generator) for the random number generator. Defaults to None
+        Returns:
+             (Cost, Duration) (tuple): Samples of the clean-up cost, in the currency of cost_per_m3, and of the
+             number of days needed to clear the volume
+    """
+    missing = [name for name in CLEANUP_RESOURCES if name not in resources]
+    if missing:
+        raise ValueError("resources is missing " + ", ".join(missing))
+    rng = np.random.default_rng(seed)
+    Volume = np.asarray(Volume, dtype=float)
+    draws = {name: sample_resource(resources[name], Volume.shape, seed=rng) for name in CLEANUP_RESOURCES}
+    Cost = draws["cost_per_m3"] * Volume
+    Duration = ((Volume / draws["truck_size_m3"]) * (draws["disposal_time_mins"] / draws["trucks"]) /
+                (draws["hrs_day"] * 60))
+    return Cost, Duration
+
+
+def cleanup_area_thresholds(road_area, impervious_area, fp_area, max_thickness):
+    """
+    Applies the clean-up thresholds of Hayes et al. (2017) to determine the range of urban surface area requiring
+    clean-up. Roads are cleaned from 0.5 mm of tephra, and roads, impervious surfaces and building roofs from 10 mm.
+    Works on single values or on arrays of many scenarios at once.
+
+        Arguments:
+            road_area (float or ndarray): Road area in square metres
+            impervious_area (float or ndarray): Impervious surface area in square metres
+            fp_area (float or ndarray): Building footprint area in square metres
+            max_thickness (float or ndarray): Maximum thickness of tephra in mm
+        Returns:
+             (cleanup_area_min, cleanup_area_max) (tuple): Minimum and maximum area requiring clean-up in square metres
+    """
+    max_thickness = np.asarray(max_thickness, dtype=float)
+    all_area = np.asarray(road_area + impervious_area + fp_area, dtype=float)
+    area = np.select([max_thickness >= 10, max_thickness >= 0.5], [all_area, np.asarray(road_area, dtype=float)], 0)
+    cleanup_area_min = area - (area * 0.1)
+    cleanup_area_max = area + (area * 0.1)
+    if cleanup_area_min.ndim == 0:
+        return float(cleanup_area_min), float(cleanup_area_max)
+    return cleanup_area_min, cleanup_area_max
+
+
+def feature_cleanup_volumes(building_area, building_thickness, road_area, road_thickness):
+    """
+    Applies the clean-up thresholds to individual buildings and road segments. Roads require clean-up from 0.5 mm of
+    tephra. From 10 mm building roofs also require clean-up, and an impervious area equal to the road area is added to
+    each road segment.
+
+        Arguments:
+            building_area (ndarray): Footprint area of each building in square metres
+            building_thickness (ndarray): Tephra thickness on each building in mm
+            road_area (ndarray): Area of each road segment in square metres
+            road_thickness (ndarray): Tephra thickness on each road segment in mm
+        Returns:
+             (building_volume, road_volume) (tuple): Volume of tephra requiring clean-up for each building and road
+             segment in cubic metres
+    """
+    building_thickness = np.asarray(building_thickness, dtype=float)
+    road_thickness = np.asarray(road_thickness, dtype=float)
+    building_volume = np.where(building_thickness >= 10, np.asarray(building_area) * (building_thickness / 1000), 0)
+    road_factor = np.select([road_thickness >= 10, road_thickness >= 0.5], [2, 1], 0)
+    road_volume = np.asarray(road_area) * (road_thickness / 1000) * road_factor
+    return building_volume, road_volume
+
+
+# --- Exposure cache ---
+EXPOSURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Geospatial_data", "cache")
+EXPOSURE_CACHE_TTL = 30 * 24 * 60 * 60
+EXPOSURE_CACHE_MAX_BYTES = 5 * 1024 ** 3
+EXPOSURE_CACHE_VERSION = 3
+BUILDING_TAGS = {"building": True}
+ROAD_COLUMNS = ["length", "highway", "lanes", "width", "geometry"]
+
+
+def exposure_cache_key(query, dist=None, tags=None, network_type="drive", osm_date=None, truncate_by_edge=False,
+                       pbf=None):
+    """
+    Builds the key used to store the exposure data for an OSM query in the local cache. The key is a hash of
+    everything that determines the data returned by OSM, so that a change to any of them results in a new download.
+
+        Arguments:
+            query (str, tuple or Polygon): Place name, (lat, lon) point or polygon used to query OSM
+            dist (float): Buffer distance in metres when the query is a point
+            tags (dict): OSM tags used to select buildings. Defaults to {"building": True}
+            network_type (str): OSMnX network type used to select roads
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z"). None uses the latest data
+            truncate_by_edge (Bool): Defines whether roads crossing the edge of the query area are kept
+            pbf (str): Path to the local .osm.pbf extract used instead of Overpass, if any
+        Returns:
+             key (str): Hexadecimal cache key
+    """
+    if isinstance(query, str):
+        kind, value = "place", query.strip().lower()
+    elif hasattr(query, "wkb_hex"):
+        kind, value = "polygon", query.wkb_hex
     else:
-        print("No csv will be produced because csv=False. If you want a csv, make csv=True")
+        kind, value = "point", [round(float(query[0]), 7), round(float(query[1]), 7), dist]
+    payload = {"kind": kind, "query": value, "tags": tags or BUILDING_TAGS, "network_type": network_type,
+               "osm_date": osm_date, "version": EXPOSURE_CACHE_VERSION}
+    if truncate_by_edge:
+        payload["truncate_by_edge"] = True
+    if pbf is not None:
+        payload["pbf"] = [os.path.abspath(pbf), os.path.getmtime(pbf)]
+    payload = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("UTF-8")).hexdigest()
 
-    # --- plotting the results ---
-    if fig == True:
-        if cleanup_area_min > 0:
-            fig1 = plt.figure(figsize=(8, 8))
-
-            ax1 = plt.subplot(3, 1, 1)
-            ax1.plot(np.sort(Volume), np.linspace(0.0, 1.0, len(Volume)))
-            # plt.xlabel('Volume [$m^3$]')
-            plt.ylabel('Cumulative density function')
-            plt.yticks([0, 0.25, 0.5, 0.75, 1])
-            # ax1.axvspan(15000, 45000, alpha=0.5, color='gray')
-            ax1.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            ax2 = plt.subplot(3, 1, 2)
-            ax2.hist(np.sort(Volume), bins=50, density=True, label="Volume")
-            ax2.set_ylabel('Probability Density')
-            ax2.set_xlabel('Volume [$m^3$]')
-            ax2.legend(loc=0, framealpha=0.5, fontsize=11)
-            ax2.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            plt.show()
-
-            # fig1.savefig(City_dir + "/" + place + '_volume.png', transparent=True, dpi=300,
-            #              bbox_inches='tight')
-            #plt.close()
+
+def _exposure_cache_paths(key, entry_dir=None):
+    entry_dir = entry_dir or os.path.join(EXPOSURE_CACHE_DIR, key)
+    return (entry_dir, os.path.join(entry_dir, "buildings.parquet"), os.path.join(entry_dir, "roads.parquet"),
+            os.path.join(entry_dir, "meta.json"))
+
+
+def _exposure_cache_entry_size(entry_dir):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(entry_dir, "*")))
+
+
+def _exposure_cache_entry_valid(key, ttl=None):
+    ttl = EXPOSURE_CACHE_TTL if ttl is None else ttl
+    entry_dir, buildings_path, roads_path, meta_path = _exposure_cache_paths(key)
+    try:
+        with open(meta_path) as f:
+            created = json.load(f)["created"]
+    except (OSError, ValueError, KeyError):
+        return False
+    return time.time() - created <= ttl and os.path.exists(buildings_path) and os.path.exists(roads_path)
+
+
+def _staging_path(path):
+    # Cache files and entries are written under a hidden name unique to the thread and moved into place with
+    # os.replace, so that other threads and processes never read a partially written entry
+    directory, name = os.path.split(path)
+    return os.path.join(directory, ".{}.{}-{}.tmp".format(name, os.getpid(), threading.get_ident()))
+
+
+def _replace_cache_entry(staging_dir, entry_dir):
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    try:
+        os.replace(staging_dir, entry_dir)
+    except OSError:
+        # Another process stored the same entry in the meantime
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _raw_exposure_path(key, layer):
+    return os.path.join(EXPOSURE_CACHE_DIR, "raw", "{}.{}.pkl".format(key, layer))
+
+
+def _write_raw_exposure(key, layer, data):
+    path = _raw_exposure_path(key, layer)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging_path = _staging_path(path)
+    pd.to_pickle(data, staging_path)
+    os.replace(staging_path, path)
+
+
+def evict_exposure_cache(ttl=None, max_bytes=None):
+    """
+    Removes cache entries older than the time-to-live, then removes the least recently used entries until the cache
+    fits within the size limit.
+
+        Arguments:
+            ttl (float): Maximum age of an entry in seconds. Defaults to EXPOSURE_CACHE_TTL
+            max_bytes (int): Maximum total size of the cache in bytes. Defaults to EXPOSURE_CACHE_MAX_BYTES
+    """
+    ttl = EXPOSURE_CACHE_TTL if ttl is None else ttl
+    max_bytes = EXPOSURE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    entries = []
+    for meta_path in glob.glob(os.path.join(EXPOSURE_CACHE_DIR, "*", "meta.json")):
+        entry_dir = os.path.dirname(meta_path)
+        try:
+            with open(meta_path) as f:
+                created = json.load(f)["created"]
+            entry = (os.path.getmtime(meta_path), _exposure_cache_entry_size(entry_dir), entry_dir)
+        except OSError:
+            # Removed by another process in the meantime
+            continue
+        except (ValueError, KeyError):
+            created = -np.inf
+        if now - created > ttl:
+            shutil.rmtree(entry_dir, ignore_errors=True)
         else:
-            print("No ash expected to require removal. No graph will be made")
+            entries.append(entry)
+    for raw_path in glob.glob(os.path.join(EXPOSURE_CACHE_DIR, "raw", "*.pkl")):
+        with contextlib.suppress(OSError):
+            if now - os.path.getmtime(raw_path) > ttl:
+                os.remove(raw_path)
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, entry_dir in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_bytes -= size
+
+
+def invalidate_exposure_cache(key=None):
+    """
+    Removes an entry from the exposure cache and the surface area index so the next run downloads it from OSM again.
+
+        Arguments:
+            key (str): Cache key returned by exposure_cache_key. If None the whole cache is cleared
+    """
+    if key is None:
+        shutil.rmtree(EXPOSURE_CACHE_DIR, ignore_errors=True)
+    else:
+        shutil.rmtree(_exposure_cache_paths(key)[0], ignore_errors=True)
+        for raw_path in glob.glob(_raw_exposure_path(key, "*")):
+            with contextlib.suppress(OSError):
+                os.remove(raw_path)
+    if os.path.exists(SURFACE_AREA_INDEX):
+        connection = _surface_area_index()
+        with connection:
+            if key is None:
+                connection.execute("DELETE FROM surface_areas")
+            else:
+                connection.execute("DELETE FROM surface_areas WHERE key = ? OR key LIKE ?", (key, key + ":%"))
+
+
+def load_cached_exposure(key, ttl=None):
+    """
+    Loads the projected building footprints and road edges for a cache key.
+
+        Arguments:
+            key (str): Cache key returned by exposure_cache_key
+            ttl (float): Maximum age of the entry in seconds. Defaults to EXPOSURE_CACHE_TTL
+        Returns:
+             (FP_area_UTM, road_UTM) (tuple): Projected buildings and road edges with their highway, lanes and
+             width tags, or None if there is no valid entry
+    """
+    import geopandas as gpd
+
+    if not _exposure_cache_entry_valid(key, ttl):
+        return None
+    entry_dir, buildings_path, roads_path, meta_path = _exposure_cache_paths(key)
+    FP_area_UTM = gpd.read_parquet(buildings_path, columns=["area", "geometry"], memory_map=True)
+    road_UTM = gpd.read_parquet(roads_path, columns=ROAD_COLUMNS, memory_map=True)
+    os.utime(meta_path)
+    return FP_area_UTM, road_UTM
+
+
+def _configure_overpass(osm_date=None):
+    import osmnx as ox
+
+    if osm_date is None:
+        overpass_settings = '[out:json][timeout:{timeout}]{maxsize}'
     else:
-        print ("No figure will be produced because fig=False. If you want a figure make fig=True")
+        overpass_settings = '[out:json][timeout:{timeout}]{maxsize}[date:"' + osm_date + '"]'
+    ox.settings.requests_timeout = 2000
+    ox.settings.overpass_settings = overpass_settings
+    from osmnx import _downloader
 
-    return()
+    if not getattr(_downloader._parse_response, "wrapped", False):
+        _downloader._parse_response = _parse_overpass_response(_downloader._parse_response)
 
-def tephra_cleanup_volume_from_point (point, buffer, place, min_thickness, max_thickness, fig, csv):
+
+# The snapshot date is a global OSMnX setting, so fetches for different osm_date values must not overlap. Threads
+# fetching the same snapshot share it, and a thread wanting another one waits until they have all finished
+_overpass_date_condition = threading.Condition()
+_overpass_date_users = {"osm_date": None, "count": 0}
+
+
+@contextlib.contextmanager
+def _overpass_date(osm_date=None):
+    with _overpass_date_condition:
+        while _overpass_date_users["count"] and _overpass_date_users["osm_date"] != osm_date:
+            _overpass_date_condition.wait()
+        if not _overpass_date_users["count"]:
+            _configure_overpass(osm_date)
+        _overpass_date_users.update(osm_date=osm_date, count=_overpass_date_users["count"] + 1)
+    try:
+        yield
+    finally:
+        with _overpass_date_condition:
+            _overpass_date_users["count"] -= 1
+            if not _overpass_date_users["count"]:
+                _overpass_date_condition.notify_all()
+
+
+class ExposureFetchError(RuntimeError):
+    """
+    Raised when exposure data cannot be obtained from OSM, e.g. when the Overpass server does not respond after
+    FETCH_ATTEMPTS attempts.
+    """
+
+
+class PlaceNotFoundError(ExposureFetchError, LookupError):
+    """
+    Raised when OSM (or the OSM extract) has no boundary or data for the place name or area queried.
     """
-    This function will estimate the volume of tephra requiring removal as part of municipal clean-up efforts.
-    The function requires the name of the place and the thickness of tephra in mm. The user can specifiy whether a
-    graph and csv file is produced with the model results.
+
+
+FETCH_ATTEMPTS = 10
+FETCH_BACKOFF = 5
+FETCH_BACKOFF_MAX = 300
+OVERPASS_ENDPOINT = "https://overpass-api.de/api"
+
+
+def overpass_slot_wait(endpoint=None):
+    """
+    Asks the Overpass server how long it will be until one of our request slots is free.
 
         Arguments:
-            place (str): Name of the place for OSMnX to search the OSM database and collect the exposure data
-            thickness (float): Thickness of tephra in mm to model across the urban area of interest
-            fig (Bool): Defines whether a graph is produced and saved of the model results (True) or not (False)
-            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            endpoint (str): Overpass API endpoint. Defaults to the OSMnX setting or OVERPASS_ENDPOINT
         Returns:
-             Volume (Dict): Returns a Dictionary of model results at the 5th, 50th, and 95th percentile for the volume
-             of tephra removal required in cubic metres
+             wait (float): Seconds until a slot is free. 0 if a slot is free now or the status is unavailable
     """
-    ox.config(timeout=2000)
-    print("Initiating tephra clean-up model for ", place)
-    substring = ","
-    if place.find(substring) != -1:
-        place_name_initial = place[:place.index(",")]
-        place_name = place_name_initial.replace(" ", "")
-        place_name_save = place_name.replace(" ", "_")
-    else:
-        place_name = place
-        place_name_save = place_name.replace(" ", "_")
-    directory = os.path.dirname(os.path.abspath(__file__))
-    Geospatial_dir = directory + "/Geospatial_data/" + place_name_save
-    if not os.path.exists(Geospatial_dir):
-        os.makedirs(Geospatial_dir)
-        print("Geospatial folder has been created")
-    else:
-        print("Geospatial folder already exists")
+    import osmnx as ox
+    import requests
 
-    print("Obtaining building footprints from OSM.")
-    for attempt in range(10):
+    endpoint = endpoint or getattr(ox.settings, "overpass_url", None) or OVERPASS_ENDPOINT
+    try:
+        status = requests.get(endpoint.rstrip("/") + "/status", timeout=10).text
+    except requests.exceptions.RequestException:
+        return 0
+    if re.search(r"Rate limit: 0\b|[1-9]\d* slots? available now", status):
+        return 0
+    waits = [int(wait) for wait in re.findall(r"in (-?\d+) seconds", status)]
+    return max(min(waits), 0) if waits else 0
+
+
+def _retryable_status(error):
+    # OSMnX reports responses that are neither OK nor JSON as "'<domain>' responded: <status> <reason> <text>". Server
+    # errors (5xx) and 429 responses are worth retrying, but other client errors (e.g. 400 for a malformed query) are not
+    status = re.search(r"responded: (\d{3})\b", str(error))
+    return status is None or int(status.group(1)) >= 500 or int(status.group(1)) == 429
+
+
+def _fetch_with_backoff(request, description, slots=None):
+    # Retries OSM requests that time out, fail to connect or fail on the server (5xx or 429 responses), waiting FETCH_BACKOFF * 2 ** attempt seconds with jitter (so that parallel workers do not retry in lockstep), or
+    # longer if Overpass reports no free slot. Each attempt holds one of the slots (if given) while it runs, but not
+    # while it waits to retry
+    import requests
+    from osmnx._errors import ResponseStatusCodeError
+
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            with slots or contextlib.nullcontext():
+                return request()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                ResponseStatusCodeError, _OverpassServerError) as error:
+            if isinstance(error, ResponseStatusCodeError) and not _retryable_status(error):
+                raise ExposureFetchError("OSM refused the request for the {}: {}".format(description, error)) from error
+            if attempt == FETCH_ATTEMPTS - 1:
+                raise ExposureFetchError("OSM did not return the {} after {} attempts: {}"
+                                         .format(description, FETCH_ATTEMPTS, error)) from error
+            delay = min(FETCH_BACKOFF_MAX, FETCH_BACKOFF * 2 ** attempt)
+            delay = max(random.uniform(delay / 2, delay), overpass_slot_wait())
+            logger.warning("Request for %s failed (%s), retrying in %.0f s", description, error, delay)
+            _record_retry()
+            time.sleep(delay)
+        except (TypeError, ValueError, KeyError) as error:
+            raise PlaceNotFoundError("OSMnX may not be able to find the location. Try using a different function "
+                                     "instead: {}".format(error)) from error
+
+
+class _OverpassServerError(Exception):
+    # Overpass answered, but with a failure rather than data: a runtime error remark (the query timed out or ran out
+    # of memory) without any elements, or an OK response that is not JSON. OSMnX reports both as an empty response
+    pass
+
+
+def _parse_overpass_response(parse_response):
+    # Wraps the OSMnX response parser so that failed Overpass requests are raised (and retried) before OSMnX saves
+    # them to its own response cache, instead of being mistaken for areas without any OSM data
+    from osmnx._errors import InsufficientResponseError
+
+    @functools.wraps(parse_response)
+    def wrapper(response):
         try:
+            response_json = parse_response(response)
+        except InsufficientResponseError as error:
+            raise _OverpassServerError(str(error)) from error
+        if isinstance(response_json, dict) and "remark" in response_json and not response_json.get("elements"):
+            raise _OverpassServerError("Overpass remarked: {}".format(response_json["remark"]))
+        return response_json
+    wrapper.wrapped = True
+    return wrapper
+
+
+def _no_osm_data(error):
+    # OSMnX raises errors for polygons without any matching OSM data, e.g. isopach tiles over the sea or bush. Failed
+    # requests are raised as _OverpassServerError by _parse_overpass_response instead
+    from osmnx._errors import InsufficientResponseError
+
+    return isinstance(error, InsufficientResponseError) or "Found no graph nodes" in str(error)
+
+
+def _empty_layer(columns):
+    import geopandas as gpd
+
+    return gpd.GeoDataFrame(columns=columns, geometry="geometry", crs="EPSG:4326")
+
+
+def _fetch_buildings(query, dist=None, tags=None, slots=None, columns=("geometry",)):
+    import osmnx as ox
+
+    tags = tags or BUILDING_TAGS
+
+    def request():
+        if isinstance(query, str):
+            return ox.features_from_place(query, tags=tags)
+        elif hasattr(query, "geom_type"):
             try:
-                buildings = ox.geometries_from_point(point, tags={"building": True},
-                                                     dist=buffer)
-                break
-            except (TypeError, ValueError, KeyError):
-                print("OSMnX may not be able to find place. "
-                      "Try using a different function instead")
-                exit()
-
-        except requests.exceptions.ReadTimeout:
-            print("Timeout")
-    print("Reprojecting buildings to UTM")
-    FP_area_UTM = ox.projection.project_gdf(buildings, to_crs=None, to_latlong=False)
-    print("Calculating footprint area.")
-    FP_area_UTM["area"] = FP_area_UTM['geometry'].area
-    fp_area = FP_area_UTM['area'].sum()
-    print("Saving building footprints to disk")
-    # FP_area_UTM[['area', 'geometry']].to_file(
-    #     "Geospatial_data/" + Study_area_name + "/" + Study_area_name + "_buildings.gpkg", driver="GPKG",
-    #     encoding='UTF-8')
-
-    print("Building footprints obtained, now obtaining roads from OSM.")
-    try:
-        roads = ox.graph_from_point(point, network_type='drive', dist=buffer)
-    except (TypeError, ValueError, KeyError):
-        print(
-            "OSMnX may not be able to find location using from_place. "
-            "Try using the tephra_cleanup_from_address instead")
-        exit()
-    print("reprojecting roads to UTM")
-    road_UTM = ox.project_graph(roads)
-    print("saving roads locally")
-    ox.io.save_graph_geopackage(road_UTM,
-                                "Geospatial_data/" + place_name + "/" + place_name + "_roads.gpkg",
-                                encoding='UTF-8')
-    print("Roads save locally")
-    road_UTM = gpd.read_file("Geospatial_data/" + place_name + "/" + place_name + "_roads.gpkg",
-                                       layer='edges')
-
-    print("Estimating road area")
-    road_UTM["area"] = road_UTM["length"] * 3
-    road_area = road_UTM['area'].sum()
-    print("Estimating impervious surface area based on road area")
-    impervious_area = road_area
-    print("Estimating building footprint area")
-
-    all_area = road_area + fp_area + impervious_area
+                return ox.features_from_polygon(query, tags=tags)
+            except ValueError as error:
+                if _no_osm_data(error):
+                    return _empty_layer(list(columns))
+                raise
+        return ox.features_from_point(query, tags=tags, dist=dist)
+    # Only the given columns are used (the footprints of buildings), so the hundreds of sparse OSM tag columns are
+    # dropped as soon as they arrive
+    return _fetch_with_backoff(request, "building footprints", slots=slots).reindex(columns=list(columns))
+
+
+def _fetch_roads(query, dist=None, network_type="drive", truncate_by_edge=False, slots=None):
+    import osmnx as ox
+
+    def request():
+        if isinstance(query, str):
+            return ox.graph_from_place(query, network_type=network_type, truncate_by_edge=truncate_by_edge)
+        elif hasattr(query, "geom_type"):
+            try:
+                return ox.graph_from_polygon(query, network_type=network_type, truncate_by_edge=truncate_by_edge)
+            except ValueError as error:
+                if _no_osm_data(error):
+                    return None
+                raise
+        return ox.graph_from_point(query, network_type=network_type, dist=dist, truncate_by_edge=truncate_by_edge)
+    return _fetch_with_backoff(request, "roads", slots=slots)
 
-    # ---------- Cleanup model thresholds ----------
 
-    print("Initiating clean-up modelling for", place)
+def _fetch_exposure(query, dist=None, tags=None, network_type="drive", truncate_by_edge=False, slots=None):
+    # Requests the buildings and roads at the same time. Each thread runs under the RunMetrics of the caller so
+    # that retries are counted
+    metrics = getattr(_active_metrics, "metrics", None)
 
-    print("Maximum tephra thickness for", place, "is:", max_thickness, "mm. Minimum  thickness is:",
-          min_thickness)
-    #####
-    #####
-    # Clean-up thresholds
-    print("Determining the appropriate clean-up threshold to use.")
-    if max_thickness >= 1000:
-        cleanup_area_min = all_area - (all_area * 0.1)
-        cleanup_area_max = all_area + (all_area * 0.1)
-    elif max_thickness >= 10:
-        cleanup_area_min = (road_area - (road_area * 0.1)) + (impervious_area - (impervious_area * 0.1)) + (
-                fp_area - (fp_area * 0.1))
-        cleanup_area_max = (road_area + (road_area * 0.1)) + (impervious_area + (impervious_area * 0.1)) + (
-                fp_area + (fp_area * 0.1))
-    elif max_thickness >= 0.5:
-        cleanup_area_min = road_area - (road_area * 0.1)
-        cleanup_area_max = road_area + (road_area * 0.1)
-    elif max_thickness < 0.5:
-        cleanup_area_min = 0
-        cleanup_area_max = 0
+    def fetch(function, *args, **kwargs):
+        with _collect_metrics(metrics):
+            return function(*args, **kwargs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        buildings = executor.submit(fetch, _fetch_buildings, query, dist=dist, tags=tags, slots=slots)
+        roads = executor.submit(fetch, _fetch_roads, query, dist=dist, network_type=network_type,
+                                truncate_by_edge=truncate_by_edge, slots=slots)
+        roads = roads.result()
+        return buildings.result(), _empty_layer(ROAD_COLUMNS) if roads is None else road_edges(roads)
 
-    # --- Monte Carlo analysis ---
-    Thickness = []
-    Area = []
-    Volume = []
-    # Dollars=[]
-    # Duration=[]
-
-    N = 10000
-    print("Calculating tephra volume requiring clean-up.")
-    for i in range(N):
-        DThickness = ((random.uniform((min_thickness), (max_thickness)) / 1000))
-        DArea = (random.uniform((cleanup_area_min), (cleanup_area_max)))
-        DVolume = (DArea * DThickness)
-        # DDollars =((random.randint(Min_cost_per_m3, Max_cost_per_m3)*DVolume)/1000)
-        # DDuration =((DVolume/(random.randint(Min_truck_size_m3, Max_truck_size_m3)))*
-        # (random.randint(Min_disposal_time_mins,Max_disposal_time_mins)/(random.randint(Min_trucks, Max_trucks)))/
-        # (random.randint(Min_hrs_day, Max_hrs_day)*60))
-
-        Thickness = Thickness + [DThickness]
-        Area = Area + [DArea]
-        Volume = Volume + [DVolume]
-        # Dollars=Dollars+[DDollars]
-        # Duration=Duration+[DDuration]
-
-    num_bins = 50
-
-    df = pd.DataFrame(Volume)
-    print(df.describe())
-
-    Percentile_50 = stats.scoreatpercentile(Volume, 50)
-    Percentile_10 = stats.scoreatpercentile(Volume, 10)
-    Percentile_90 = stats.scoreatpercentile(Volume, 90)
-    CleanUpVolume = pd.DataFrame([[place, Percentile_10, Percentile_50, Percentile_90]],
-                                 columns=["Place",
-                                          "10th Percentile",
-                                          "50th Percentile",
-                                          "90th Percentile"])
-    print(CleanUpVolume)
-    if csv==True:
-        path_csv = "Results/" + place + "_" + ".csv"
-        CleanUpVolume.to_csv(path_csv, index=False)
-        path_temp = "Results/temp/" + place_name_save + "_" + ".csv"
-        CleanUpVolume.to_csv(path_temp, index=False)
+
+# --- Offline OSM extract ---
+_pbf_layers = {}
+_pbf_impervious = {}
+# One lock per extract, so that threads querying the same extract wait for a single read instead of each reading it
+_pbf_locks = {}
+_pbf_locks_lock = threading.Lock()
+
+
+def _pbf_lock(pbf):
+    with _pbf_locks_lock:
+        return _pbf_locks.setdefault(pbf, threading.Lock())
+
+
+def load_pbf_exposure(pbf):
+    """
+    Reads the building footprints, drivable roads and administrative boundaries from a local .osm.pbf extract and
+    builds their spatial indexes. The extract is read once per process, so later queries only use the indexes. The
+    whole extract is held in memory for the life of the process, including for tiled and lean isopach runs.
+
+        Arguments:
+            pbf (str): Path to a .osm.pbf regional extract (e.g. from Geofabrik)
+        Returns:
+             (buildings, roads, boundaries) (tuple): GeoDataFrames in WGS84. Roads have a "length" column in metres
+             and the highway, lanes and width tags. Boundaries have "name" and "admin_level" columns
+    """
+    pbf = os.path.abspath(pbf)
+    layers = _pbf_layers.get(pbf)
+    if layers is not None:
+        return layers
+    with _pbf_lock(pbf):
+        layers = _pbf_layers.get(pbf)
+        if layers is not None:
+            return layers
+        try:
+            import pyrosm
+        except ImportError:
+            raise ImportError("pyrosm is required to read exposure data from a .osm.pbf extract")
+        osm = pyrosm.OSM(pbf)
+        logger.info("Reading building footprints from %s", pbf)
+        buildings = osm.get_buildings()[["geometry"]]
+        logger.info("Reading roads from %s", pbf)
+        roads = osm.get_network(network_type="driving").reindex(columns=ROAD_COLUMNS)
+        boundaries = osm.get_boundaries().reindex(columns=["name", "admin_level", "geometry"])
+        logger.info("Building spatial indexes")
+        buildings.sindex
+        roads.sindex
+        layers = _pbf_layers[pbf] = (buildings, roads, boundaries)
+        return layers
+
+
+def load_pbf_impervious(pbf):
+    """
+    Reads the impervious surfaces selected by IMPERVIOUS_TAGS (car parks, footpaths, etc.) from a local .osm.pbf
+    extract and builds their spatial index. The extract is read once per process.
+
+        Arguments:
+            pbf (str): Path to a .osm.pbf regional extract (e.g. from Geofabrik)
+        Returns:
+             impervious (GeoDataFrame): Impervious surfaces in WGS84 with their highway, lanes and width tags
+    """
+    pbf = os.path.abspath(pbf)
+    impervious = _pbf_impervious.get(pbf)
+    if impervious is not None:
+        return impervious
+    with _pbf_lock(pbf + ":impervious"):
+        impervious = _pbf_impervious.get(pbf)
+        if impervious is not None:
+            return impervious
+        try:
+            import pyrosm
+        except ImportError:
+            raise ImportError("pyrosm is required to read exposure data from a .osm.pbf extract")
+        logger.info("Reading impervious surfaces from %s", pbf)
+        impervious = pyrosm.OSM(pbf).get_data_by_custom_criteria(custom_filter=IMPERVIOUS_TAGS, keep_nodes=False)
+        impervious = impervious.reindex(columns=["highway", "lanes", "width", "geometry"])
+        impervious.sindex
+        _pbf_impervious[pbf] = impervious
+        return impervious
+
+
+def _pbf_query_polygon(pbf, query, dist=None):
+    from shapely.geometry import box
+
+    if isinstance(query, str):
+        polygon = _pbf_place_boundary(load_pbf_exposure(pbf)[2], query)
+    elif hasattr(query, "geom_type"):
+        polygon = query
     else:
-        print("No csv will be produced because csv=False. If you want a csv, make csv=True")
+        import osmnx as ox
+        north, south, east, west = ox.utils_geo.bbox_from_point(query, dist=dist)
+        polygon = box(west, south, east, north)
+    return polygon
+
+
+def _pbf_place_boundary(boundaries, query):
+    # Finds the boundary of a place such as "Rotorua, Bay of Plenty, New Zealand" by its name. Where several
+    # boundaries share the name, only those within a boundary named by the rest of the query are kept, then the most
+    # local admin_level (e.g. the city over the district of the same name)
+    names = [name.strip().lower() for name in query.split(",")]
+    boundary_names = boundaries["name"].str.lower()
+    place = boundaries[boundary_names == names[0]]
+    if len(place) == 0:
+        raise PlaceNotFoundError("{} could not be found in the OSM extract. Try using a different function "
+                                 "instead".format(query))
+    for name in names[1:]:
+        enclosing = boundaries[boundary_names == name]
+        if len(place) > 1 and len(enclosing):
+            within = place.representative_point().within(enclosing.unary_union)
+            if within.any():
+                place = place[within]
+    if len(place) > 1:
+        admin_level = pd.to_numeric(place["admin_level"], errors="coerce")
+        if admin_level.notna().any():
+            place = place[admin_level == admin_level.max()]
+    if len(place) > 1:
+        raise PlaceNotFoundError("{} matches {} boundaries in the OSM extract. Add the name of the region it lies in, "
+                                 "e.g. \"{}, <region>\"".format(query, len(place), query.split(",")[0].strip()))
+    return place.geometry.iloc[0]
+
+
+def _query_pbf(pbf, query, dist=None):
+    buildings, roads, boundaries = load_pbf_exposure(pbf)
+    polygon = _pbf_query_polygon(pbf, query, dist=dist)
+    return (buildings.iloc[buildings.sindex.query(polygon, predicate="intersects")],
+            roads.iloc[roads.sindex.query(polygon, predicate="intersects")])
+
+
+def road_edges(road_graph):
+    """
+    Converts a road network graph into a table of road edges without writing it to disk. Two-way roads are counted
+    once, as they are when the graph is saved to a GeoPackage.
 
-    # --- plotting the results ---
-    if fig == True:
-        if cleanup_area_min > 0:
-            fig1 = plt.figure(figsize=(8, 8))
-
-            ax1 = plt.subplot(3, 1, 1)
-            ax1.plot(np.sort(Volume), np.linspace(0.0, 1.0, len(Volume)))
-            # plt.xlabel('Volume [$m^3$]')
-            plt.ylabel('Cumulative density function')
-            plt.yticks([0, 0.25, 0.5, 0.75, 1])
-            # ax1.axvspan(15000, 45000, alpha=0.5, color='gray')
-            ax1.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            ax2 = plt.subplot(3, 1, 2)
-            ax2.hist(np.sort(Volume), bins=50, density=True, label="Volume")
-            ax2.set_ylabel('Probability Density')
-            ax2.set_xlabel('Volume [$m^3$]')
-            ax2.legend(loc=0, framealpha=0.5, fontsize=11)
-            ax2.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            plt.show()
-
-            # fig1.savefig(City_dir + "/" + place + '_volume.png', transparent=True, dpi=300,
-            #              bbox_inches='tight')
-            #plt.close()
-        else:
-            print("No ash expected to require removal. No graph will be made")
+        Arguments:
+            road_graph (MultiDiGraph): Road network from OSMnX
+        Returns:
+             road_edges (GeoDataFrame): Road edges with "length", "highway", "lanes", "width" and "geometry" columns,
+             in the crs of the graph
+    """
+    import osmnx as ox
+
+    road_graph = ox.convert.to_undirected(road_graph)
+    return ox.graph_to_gdfs(road_graph, nodes=False, fill_edge_geometry=True).reindex(columns=ROAD_COLUMNS)
+
+
+def road_tags(road_UTM):
+    """
+    Cleans the highway, lanes and width tags of road edges so they can be stored compactly and used to estimate road
+    widths. Edges merged by OSMnX can carry a list of values, in which case the first highway type and the largest
+    number of lanes and width are kept. Lanes and widths are parsed to numbers in metres (e.g. "7.5 m"), with missing
+    or unreadable values set to NaN.
+
+        Arguments:
+            road_UTM (GeoDataFrame): Road edges with "highway", "lanes" and "width" columns
+        Returns:
+             road_UTM (GeoDataFrame): Road edges with a categorical "highway" column and float "lanes" and "width"
+             columns
+    """
+    for tag in ("highway", "lanes", "width"):
+        if tag not in road_UTM:
+            road_UTM[tag] = np.nan
+    highway = road_UTM["highway"]
+    is_list = highway.map(lambda value: isinstance(value, list)).to_numpy(dtype=bool)
+    if is_list.any():
+        highway = highway.where(~is_list, highway[is_list].str[0])
+    road_UTM["highway"] = highway.astype("category")
+    for tag in ("lanes", "width"):
+        values = road_UTM[tag].explode().astype(str).str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+        road_UTM[tag] = pd.to_numeric(values, errors="coerce").groupby(level=0).max().astype("float32")
+    return road_UTM
+
+
+def utm_crs(*layers):
+    """
+    Selects the UTM zone containing the centre of the bounds of one or more layers in WGS84. Buildings, roads and
+    other surfaces of a query are all projected to this one crs.
+
+        Arguments:
+            layers (GeoDataFrame): Layers in WGS84. Empty layers are ignored, but at least one must have features
+        Returns:
+             crs (str): EPSG code of the UTM zone, e.g. "EPSG:32760"
+    """
+    bounds = np.array([layer.total_bounds for layer in layers if len(layer)])
+    if not len(bounds):
+        raise ValueError("The UTM zone cannot be selected from empty layers")
+    lon = (bounds[:, 0].min() + bounds[:, 2].max()) / 2
+    lat = (bounds[:, 1].min() + bounds[:, 3].max()) / 2
+    zone = int(np.floor((lon + 180) / 6)) % 60 + 1
+    return "EPSG:{}".format((32600 if lat >= 0 else 32700) + zone)
+
+
+def _query_extent(query, dist=None, pbf=None):
+    # Area of a query in WGS84, used to select the UTM zone of queries without any buildings or roads
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    if hasattr(query, "geom_type"):
+        return gpd.GeoSeries([query], crs="EPSG:4326")
+    elif not isinstance(query, str):
+        return gpd.GeoSeries([Point(query[1], query[0])], crs="EPSG:4326")
+    elif pbf is not None:
+        return gpd.GeoSeries([_pbf_query_polygon(pbf, query)], crs="EPSG:4326")
+    import osmnx as ox
+
+    return _fetch_with_backoff(lambda: ox.geocode_to_gdf(query), "boundary").geometry
+
+
+def get_exposure(query, dist=None, tags=None, network_type="drive", osm_date=None, use_cache=True,
+                 truncate_by_edge=False, pbf=None):
+    """
+    Obtains building footprints and road edges projected to UTM for an OSM query. Data are loaded from the local
+    exposure cache when available and otherwise downloaded from OSM (or read from a local extract), projected once to
+    the shared crs from utm_crs and stored in the cache. Buildings and roads are requested from Overpass at the same
+    time. Raises PlaceNotFoundError if the query cannot be found and ExposureFetchError if OSM does not respond.
+
+        Arguments:
+            query (str, tuple or Polygon): Place name, (lat, lon) point or polygon (in WGS84) used to query OSM
+            dist (float): Buffer distance in metres when the query is a point
+            tags (dict): OSM tags used to select buildings. Defaults to {"building": True}
+            network_type (str): OSMnX network type used to select roads
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z"). None uses the latest data
+            use_cache (Bool): Defines whether cached data are used (True) or re-downloaded from OSM (False)
+            truncate_by_edge (Bool): Defines whether roads crossing the edge of the query area are kept (True) or
+            only roads with both ends inside it (False)
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. The extract only
+            contains drivable roads and the building tags are not used. Defaults to None
+        Returns:
+             (FP_area_UTM, road_UTM) (tuple): Building footprints with an "area" column and road edges with "length",
+             "highway", "lanes" and "width" columns, both projected to the same UTM crs
+    """
+    key = exposure_cache_key(query, dist=dist, tags=tags, network_type=network_type, osm_date=osm_date,
+                             truncate_by_edge=truncate_by_edge, pbf=pbf)
+    if use_cache:
+        with _stage("cache_read") as record:
+            cached = load_cached_exposure(key)
+            if cached is not None:
+                record["features"] = len(cached[0]) + len(cached[1])
+                record["bytes_read"] = _exposure_cache_entry_size(_exposure_cache_paths(key)[0])
+        if cached is not None:
+            logger.info("Exposure data loaded from cache")
+            return cached
+    raw_path = _raw_exposure_path(key, "exposure")
+    if use_cache and os.path.exists(raw_path):
+        logger.info("Exposure data loaded from the download of run_parallel")
+        buildings, roads = pd.read_pickle(raw_path)
     else:
-        print ("No figure will be produced because fig=False. If you want a figure make fig=True")
+        buildings, roads = _obtain_exposure(query, dist=dist, tags=tags, network_type=network_type, osm_date=osm_date,
+                                            truncate_by_edge=truncate_by_edge, pbf=pbf)
+    with _stage("projection") as record:
+        if len(buildings) or len(roads):
+            crs = utm_crs(buildings, roads)
+        else:
+            crs = utm_crs(_query_extent(query, dist=dist, pbf=pbf))
+        logger.info("Reprojecting buildings and roads to %s", crs)
+        FP_area_UTM = buildings.to_crs(crs)
+        road_UTM = roads.to_crs(crs)
+        logger.info("Calculating footprint area.")
+        FP_area_UTM["area"] = FP_area_UTM['geometry'].area
+        record["features"] = len(FP_area_UTM) + len(road_UTM)
+    with contextlib.suppress(OSError):
+        os.remove(raw_path)
+    if not len(FP_area_UTM) and not len(road_UTM):
+        # An empty response may still be a failed request that OSMnX could not tell apart, so it is never cached
+        logger.info("No buildings or roads found for %s, not caching the empty result",
+                       query.bounds if hasattr(query, "geom_type") else query)
+        road_UTM = road_tags(road_UTM.reset_index(drop=True).reindex(columns=ROAD_COLUMNS))
+        return FP_area_UTM[['area', 'geometry']], road_UTM
+
+    entry_dir = _exposure_cache_paths(key)[0]
+    if not os.path.exists(EXPOSURE_CACHE_DIR):
+        os.makedirs(EXPOSURE_CACHE_DIR, exist_ok=True)
+    staging_dir = _staging_path(entry_dir)
+    os.makedirs(staging_dir)
+    _, buildings_path, roads_path, meta_path = _exposure_cache_paths(key, staging_dir)
+    with _stage("buildings_write") as record:
+        logger.info("Saving building footprints to disk")
+        FP_area_UTM[['area', 'geometry']].reset_index(drop=True).to_parquet(buildings_path)
+        record["bytes_written"] = os.path.getsize(buildings_path)
+    with _stage("roads_write") as record:
+        logger.info("saving roads locally")
+        road_UTM = road_tags(road_UTM.reset_index(drop=True).reindex(columns=ROAD_COLUMNS))
+        road_UTM.to_parquet(roads_path)
+        record["bytes_written"] = os.path.getsize(roads_path)
+        logger.info("Roads saved locally")
+
+    with open(meta_path, "w") as f:
+        json.dump({"created": time.time(), "query": str(query), "dist": dist, "network_type": network_type,
+                   "osm_date": osm_date, "pbf": pbf}, f)
+    _replace_cache_entry(staging_dir, entry_dir)
+    evict_exposure_cache()
+    return FP_area_UTM, road_UTM
+
+
+def _obtain_exposure(query, dist=None, tags=None, network_type="drive", osm_date=None, truncate_by_edge=False,
+                     pbf=None, slots=None):
+    with _stage("fetch") as record:
+        if pbf is None:
+            logger.info("Obtaining building footprints and roads from OSM.")
+            with _overpass_date(osm_date):
+                buildings, roads = _fetch_exposure(query, dist=dist, tags=tags, network_type=network_type,
+                                                   truncate_by_edge=truncate_by_edge, slots=slots)
+        else:
+            logger.info("Obtaining building footprints and roads from the OSM extract.")
+            buildings, roads = _query_pbf(pbf, query, dist=dist)
+        record["features"] = len(buildings) + len(roads)
+    return buildings, roads
 
-    return()
 
-def tephra_cleanup_volume_from_isopach (name, isopach, fig, csv):
+def download_exposure(query, dist=None, osm_date=None, use_cache=True, pbf=None, impervious=False, slots=None):
     """
+    Downloads the building footprints and road edges (and optionally the impervious surfaces) for an OSM query without
+    projecting them, and stages them in the exposure cache. The next get_exposure for the query then only has to
+    project the data. Used by run_parallel to download in threads while the projection runs in worker processes.
 
-    :param area:
-    :param isopach:
-    :param fig:
-    :param csv:
-    :return:
-    """
-    ox.config(timeout=2000)
-    directory = os.path.dirname(os.path.abspath(__file__))
-    Geospatial_dir = directory + "/Geospatial_data/" + name
-    if not os.path.exists(Geospatial_dir):
-        os.makedirs(Geospatial_dir)
-        print("Geospatial folder has been created")
+        Arguments:
+            query (str, tuple or Polygon): Place name, (lat, lon) point or polygon (in WGS84) used to query OSM
+            dist (float): Buffer distance in metres when the query is a point
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z"). None uses the latest data
+            use_cache (Bool): Defines whether cached data are kept (True) or removed and downloaded again (False)
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+            impervious (Bool): Defines whether the impervious surfaces are downloaded as well
+            slots (Semaphore): Bounds the number of Overpass requests running at once across threads. Defaults to None
+    """
+    key = exposure_cache_key(query, dist=dist, osm_date=osm_date, pbf=pbf)
+    if not use_cache:
+        invalidate_exposure_cache(key)
+    if not (_exposure_cache_entry_valid(key) or os.path.exists(_raw_exposure_path(key, "exposure"))):
+        _write_raw_exposure(key, "exposure", _obtain_exposure(query, dist=dist, osm_date=osm_date, pbf=pbf,
+                                                              slots=slots))
+    impervious_path = os.path.join(_exposure_cache_paths(key)[0], "impervious.parquet")
+    if impervious and not (os.path.exists(impervious_path) or os.path.exists(_raw_exposure_path(key, "impervious"))):
+        _write_raw_exposure(key, "impervious", _obtain_impervious(query, dist=dist, osm_date=osm_date, pbf=pbf,
+                                                                  slots=slots))
+
+
+# --- Surface area index ---
+SURFACE_AREA_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Geospatial_data",
+                                  "surface_areas.sqlite")
+_surface_area_connections = {}
+DEFAULT_ROAD_WIDTH = 3
+LANE_WIDTH = 3.5
+# Typical carriageway widths in metres of each OSM highway type, used when roads have no width or lanes tag
+ROAD_WIDTHS = {"motorway": 14, "trunk": 11, "primary": 10, "secondary": 8, "tertiary": 7, "unclassified": 5.5,
+               "residential": 6, "living_street": 5, "service": 4, "motorway_link": 5, "trunk_link": 5,
+               "primary_link": 5, "secondary_link": 5, "tertiary_link": 5, "road": 5, "track": 3, "pedestrian": 5,
+               "footway": 2, "cycleway": 2, "path": 1.5, "steps": 2}
+IMPERVIOUS_TAGS = {"amenity": ["parking"], "highway": ["footway", "pedestrian", "path", "cycleway", "steps"]}
+
+
+def _surface_area_index():
+    # Connections are not shared with forked worker processes
+    connection = _surface_area_connections.get((SURFACE_AREA_INDEX, os.getpid()))
+    if connection is None:
+        index_dir = os.path.dirname(SURFACE_AREA_INDEX)
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        connection = sqlite3.connect(SURFACE_AREA_INDEX, check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS surface_areas (key TEXT PRIMARY KEY, query TEXT, dist REAL, "
+                           "osm_date TEXT, road_area REAL, impervious_area REAL, fp_area REAL, created REAL)")
+        _surface_area_connections[(SURFACE_AREA_INDEX, os.getpid())] = connection
+    return connection
+
+
+def road_width(road_UTM, road_widths=None):
+    """
+    Estimates the width of each road edge in one vectorised pass. The width tag is used where present, then the number
+    of lanes multiplied by LANE_WIDTH, then the typical width of the highway type from the lookup table.
+
+        Arguments:
+            road_UTM (GeoDataFrame): Road edges with "highway", "lanes" and "width" columns, see road_tags
+            road_widths (dict): Width in metres of each highway type, e.g. ROAD_WIDTHS. Types missing from the table
+            are DEFAULT_ROAD_WIDTH wide. None gives every road a width of DEFAULT_ROAD_WIDTH, as in Hayes et al. (2017)
+        Returns:
+             width (ndarray): Width of each road edge in metres
+    """
+    if road_widths is None or "highway" not in road_UTM:
+        return np.full(len(road_UTM), DEFAULT_ROAD_WIDTH, dtype=float)
+    width = road_UTM["highway"].map(road_widths).to_numpy(dtype=float, na_value=np.nan)
+    width[np.isnan(width)] = DEFAULT_ROAD_WIDTH
+    lanes = road_UTM["lanes"].to_numpy(dtype=float, na_value=np.nan) * LANE_WIDTH
+    tagged = road_UTM["width"].to_numpy(dtype=float, na_value=np.nan)
+    width = np.where(lanes > 0, lanes, width)
+    return np.where(tagged > 0, tagged, width)
+
+
+def get_impervious_surfaces(query, dist=None, osm_date=None, use_cache=True, pbf=None):
+    """
+    Obtains the impervious surfaces other than roads (car parks, footpaths, etc. selected by IMPERVIOUS_TAGS) for an
+    OSM query, projected to the crs of the road edges. They are stored alongside the cached exposure data of the query.
+
+        Arguments:
+            query (str, tuple or Polygon): Place name, (lat, lon) point or polygon (in WGS84) used to query OSM
+            dist (float): Buffer distance in metres when the query is a point
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z"). None uses the latest data
+            use_cache (Bool): Defines whether cached data are used (True) or re-downloaded from OSM (False)
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+        Returns:
+             impervious_UTM (GeoDataFrame): Impervious surfaces with the area of polygons, the length of lines and
+             their highway, lanes and width tags
+    """
+    import geopandas as gpd
+
+    road_UTM = get_exposure(query, dist=dist, osm_date=osm_date, use_cache=use_cache, pbf=pbf)[1]
+    key = exposure_cache_key(query, dist=dist, osm_date=osm_date, pbf=pbf)
+    path = os.path.join(_exposure_cache_paths(key)[0], "impervious.parquet")
+    if use_cache and os.path.exists(path):
+        return gpd.read_parquet(path, memory_map=True)
+    raw_path = _raw_exposure_path(key, "impervious")
+    if use_cache and os.path.exists(raw_path):
+        impervious = pd.read_pickle(raw_path)
     else:
-        print("Geospatial folder already exists")
+        impervious = _obtain_impervious(query, dist=dist, osm_date=osm_date, pbf=pbf)
+    impervious_UTM = road_tags(impervious.reindex(columns=["highway", "lanes", "width", "geometry"])
+                               .reset_index(drop=True).to_crs(road_UTM.crs))
+    polygons = impervious_UTM.geom_type.isin(["Polygon", "MultiPolygon"]).to_numpy()
+    impervious_UTM["area"] = np.where(polygons, impervious_UTM.area, 0)
+    impervious_UTM["length"] = np.where(polygons, 0, impervious_UTM.length)
+    staging_path = _staging_path(path)
+    impervious_UTM.to_parquet(staging_path)
+    os.replace(staging_path, path)
+    with contextlib.suppress(OSError):
+        os.remove(raw_path)
+    return impervious_UTM
+
+
+def _obtain_impervious(query, dist=None, osm_date=None, pbf=None, slots=None):
+    with _stage("impervious_fetch") as record:
+        if pbf is None:
+            logger.info("Obtaining impervious surfaces from OSM.")
+            with _overpass_date(osm_date):
+                impervious = _fetch_buildings(query, dist=dist, tags=IMPERVIOUS_TAGS, slots=slots,
+                                              columns=("highway", "lanes", "width", "geometry"))
+        else:
+            logger.info("Obtaining impervious surfaces from the OSM extract.")
+            impervious = load_pbf_impervious(pbf)
+            impervious = impervious.iloc[impervious.sindex.query(_pbf_query_polygon(pbf, query, dist=dist),
+                                                                 predicate="intersects")]
+        record["features"] = len(impervious)
+    return impervious
 
-    print("Obtaining building footprints from OSM.")
-    isopach = isopach.to_crs("EPSG:4326")
-    isopach_geom = isopach
-    isopach_geom['dissolve'] = 1
-    isopach_geom = isopach_geom.dissolve(by='dissolve')
-    isopach_geom = isopach_geom["geometry"].iloc[0]
-    for attempt in range(10):
-        try:
-            try:
-                buildings = ox.geometries_from_polygon(isopach_geom, tags={"building": True})
-                break
-            except (TypeError, ValueError, KeyError):
-                print("Error")
-                exit()
-
-        except requests.exceptions.ReadTimeout:
-            print("Timeout")
-    print("Reprojecting buildings to UTM")
-    FP_area_UTM = ox.projection.project_gdf(buildings, to_crs=None, to_latlong=False)
-    print("Calculating footprint area.")
-    FP_area_UTM["area"] = FP_area_UTM['geometry'].area
-    fp_area = FP_area_UTM['area'].sum()
-    print("Saving building footprints to disk")
-    FP_area_UTM[['area', 'geometry']].to_file(
-        "Geospatial_data/" + name + "/" + name + "_buildings.gpkg", driver="GPKG",
-        encoding='UTF-8')
-
-    print("Building footprints obtained, now obtaining roads from OSM.")
-    try:
-        roads = ox.graph_from_polygon(isopach_geom, network_type='drive')
-    except (TypeError, ValueError, KeyError):
-        print(
-            "Error")
-        exit()
-    print("reprojecting roads to UTM")
-    road_UTM = ox.project_graph(roads)
-    print("saving roads locally")
-    ox.io.save_graph_geopackage(road_UTM,
-                                "Geospatial_data/" + name + "/" + name + "_roads.gpkg",
-                                encoding='UTF-8')
-    print("Roads saved locally")
-    road_UTM = gpd.read_file("Geospatial_data/" + name + "/" + name + "_roads.gpkg",
-                                   layer='edges')
-
-    print("Estimating road area")
-    road_UTM["area"] = road_UTM["length"] * 3
-    road_area = road_UTM['area'].sum()
-    print("Estimating impervious surface area based on road area")
-    impervious_area = road_area
-    print("Estimating building footprint area")
-    fp_area = FP_area_UTM['area'].sum()
-    all_area = road_area + fp_area + impervious_area
 
+def compute_surface_areas(FP_area_UTM, road_UTM, road_widths=None, impervious_UTM=None):
+    """
+    Calculates the urban surface areas used by the clean-up threshold model.
 
-    # ---------- Cleanup model thresholds ----------
-    print("Initiating clean-up modelling for", name)
+        Arguments:
+            FP_area_UTM (GeoDataFrame): Projected building footprints with an "area" column
+            road_UTM (GeoDataFrame): Projected road edges with a "length" column
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM tags,
+            see road_width. None gives every road a width of 3 m
+            impervious_UTM (GeoDataFrame): Impervious surfaces from get_impervious_surfaces. Footpaths are given the
+            width of their highway type in road_widths (or ROAD_WIDTHS). None sets the impervious area equal to the
+            road area
+        Returns:
+             (road_area, impervious_area, fp_area) (tuple): Surface areas in square metres
+    """
+    with _stage("surface_areas") as record:
+        logger.info("Estimating road area")
+        road_UTM["area"] = road_UTM["length"].to_numpy(dtype=float) * road_width(road_UTM, road_widths)
+        road_area = road_UTM['area'].sum()
+        if impervious_UTM is None:
+            logger.info("Estimating impervious surface area based on road area")
+            impervious_area = road_area
+        else:
+            logger.info("Estimating impervious surface area")
+            impervious_area = (impervious_UTM["area"].sum() +
+                               (impervious_UTM["length"].to_numpy(dtype=float) *
+                                road_width(impervious_UTM, road_widths or ROAD_WIDTHS)).sum())
+        logger.info("Estimating building footprint area")
+        fp_area = FP_area_UTM['area'].sum()
+        record["features"] = len(FP_area_UTM) + len(road_UTM)
+    return road_area, impervious_area, fp_area
+
+
+def _surface_area_key(query, dist=None, osm_date=None, pbf=None, road_widths=None, impervious=False):
+    # Areas from the default model share the exposure cache key, others add a suffix so invalidation removes both
+    key = exposure_cache_key(query, dist=dist, osm_date=osm_date, pbf=pbf)
+    if road_widths is None and not impervious:
+        return key
+    settings = json.dumps([road_widths, bool(impervious), DEFAULT_ROAD_WIDTH, LANE_WIDTH, IMPERVIOUS_TAGS],
+                          sort_keys=True)
+    return key + ":" + hashlib.sha1(settings.encode("UTF-8")).hexdigest()
+
+
+def lookup_surface_areas(query, dist=None, osm_date=None, ttl=None, pbf=None, road_widths=None, impervious=False):
+    """
+    Looks up the precomputed surface areas for an OSM query in the surface area index.
 
+        Arguments:
+            query (str or tuple): Place name or (lat, lon) point
+            dist (float): Buffer distance in metres when the query is a point
+            osm_date (str): OSM snapshot date. None uses the latest data
+            ttl (float): Maximum age of the entry in seconds. Defaults to EXPOSURE_CACHE_TTL
+            pbf (str): Path to the local .osm.pbf extract used instead of Overpass, if any
+            road_widths (dict): Width of each highway type the areas were calculated with, see road_width
+            impervious (Bool): Defines whether the areas were calculated with the impervious surface layer
+        Returns:
+             (road_area, impervious_area, fp_area) (tuple): Surface areas in square metres, or None if not indexed
+    """
+    ttl = EXPOSURE_CACHE_TTL if ttl is None else ttl
+    key = _surface_area_key(query, dist=dist, osm_date=osm_date, pbf=pbf, road_widths=road_widths,
+                            impervious=impervious)
+    row = _surface_area_index().execute(
+        "SELECT road_area, impervious_area, fp_area, created FROM surface_areas WHERE key = ?", (key,)).fetchone()
+    if row is None or time.time() - row[3] > ttl:
+        return None
+    return row[0], row[1], row[2]
 
-    #####
-    #####
-    crs = road_UTM.crs
-    isopach = isopach.to_crs(crs)
-    FP_area_UTM = FP_area_UTM.to_crs(crs)
-    Thickness_buildings = gpd.sjoin(FP_area_UTM, isopach, how="inner", op='intersects')
-    Thickness_buildings['volume_min'] = Thickness_buildings['area']*(Thickness_buildings['min_thick']/1000)
-    Thickness_buildings['volume_max'] = Thickness_buildings['area']*(Thickness_buildings['max_thick']/1000)
 
-    Thickness_roads = gpd.sjoin(road_UTM, isopach, how="inner", op='intersects')
-    Thickness_roads['volume_min'] = Thickness_roads['area']*(Thickness_roads['min_thick']/1000)
-    Thickness_roads['volume_max'] = Thickness_roads['area']*(Thickness_roads['max_thick']/1000)
+def get_surface_areas(query, dist=None, osm_date=None, use_cache=True, pbf=None, road_widths=None, impervious=False):
+    """
+    Obtains the road, impervious and building footprint areas for an OSM query. Areas are read from the surface area
+    index when available, otherwise they are calculated from the exposure data and added to the index.
 
+        Arguments:
+            query (str or tuple): Place name or (lat, lon) point used to query OSM
+            dist (float): Buffer distance in metres when the query is a point
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z"). None uses the latest data
+            use_cache (Bool): Defines whether indexed and cached data are used (True) or recalculated (False)
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM tags
+            (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            impervious (Bool): Defines whether the impervious area is obtained from OSM car parks and footpaths (True)
+            or set equal to the road area (False)
+        Returns:
+             (road_area, impervious_area, fp_area) (tuple): Surface areas in square metres
+    """
+    if use_cache:
+        with _stage("index_lookup"):
+            areas = lookup_surface_areas(query, dist=dist, osm_date=osm_date, pbf=pbf, road_widths=road_widths,
+                                         impervious=impervious)
+        if areas is not None:
+            logger.info("Surface areas loaded from index")
+            return areas
+    FP_area_UTM, road_UTM = get_exposure(query, dist=dist, osm_date=osm_date, use_cache=use_cache, pbf=pbf)
+    impervious_UTM = None
+    if impervious:
+        impervious_UTM = get_impervious_surfaces(query, dist=dist, osm_date=osm_date, use_cache=use_cache, pbf=pbf)
+    areas = compute_surface_areas(FP_area_UTM, road_UTM, road_widths=road_widths, impervious_UTM=impervious_UTM)
+    connection = _surface_area_index()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO surface_areas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (_surface_area_key(query, dist=dist, osm_date=osm_date, pbf=pbf, road_widths=road_widths,
+                                              impervious=impervious), str(query), dist,
+                            osm_date, float(areas[0]), float(areas[1]), float(areas[2]), time.time()))
+    return areas
+
+
+def build_surface_area_index(queries, dist=None, osm_date=None, use_cache=True, pbf=None, road_widths=None,
+                             impervious=False):
+    """
+    Adds the surface areas for many places or points to the surface area index so that later clean-up runs do not
+    need to touch any geometry.
 
-    # Clean-up thresholds
-    print("Determining the appropriate clean-up threshold to use.")
-    # high thickness areas
-    zone_1_buildings_min = Thickness_buildings.loc[Thickness_buildings['min_thick'] >= 1000]
-    zone_1_buildings_volume_min = zone_1_buildings_min['volume_min'].sum()
-    zone_1_roads_min = Thickness_roads.loc[Thickness_roads['min_thick']>=1000]
-    zone_1_roads_volume_min = zone_1_roads_min['volume_min'].sum()
+        Arguments:
+            queries (list): Place names, or (lat, lon) points which are buffered by dist
+            dist (float): Buffer distance in metres when the queries are points
+            osm_date (str): OSM snapshot date. None uses the latest data
+            use_cache (Bool): Defines whether existing index entries are kept (True) or recalculated (False)
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM tags
+            (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            impervious (Bool): Defines whether the impervious area is obtained from OSM car parks and footpaths (True)
+            or set equal to the road area (False)
+        Returns:
+             Surface_areas (DataFrame): Surface areas in square metres for each query
+    """
+    rows = []
+    for query in queries:
+        road_area, impervious_area, fp_area = get_surface_areas(query, dist=dist, osm_date=osm_date,
+                                                                use_cache=use_cache, pbf=pbf,
+                                                                road_widths=road_widths, impervious=impervious)
+        rows.append([query, road_area, impervious_area, fp_area])
+    return pd.DataFrame(rows, columns=["Place", "road_area", "impervious_area", "fp_area"])
 
-    zone_1_buildings_max = Thickness_buildings.loc[Thickness_buildings['max_thick'] >= 1000]
-    zone_1_buildings_volume_max = zone_1_buildings_max['volume_max'].sum()
-    zone_1_roads_max = Thickness_roads.loc[Thickness_roads['max_thick']>=1000]
-    zone_1_roads_volume_max = zone_1_roads_max['volume_max'].sum()
 
-    zone_1_volume_min = (zone_1_buildings_volume_min + (zone_1_roads_volume_min*2)) - ((zone_1_buildings_volume_min + (zone_1_roads_volume_min*2))*0.1)
-    zone_1_volume_max = (zone_1_buildings_volume_max + (zone_1_roads_volume_max*2)) + ((zone_1_buildings_volume_max + (zone_1_roads_volume_max*2))*0.1)
+# --- Isopach overlay ---
+def disjoint_isopach_bands(isopach):
+    """
+    Removes the overlap between isopach bands so that every location falls in exactly one band. Isopachs drawn as
+    nested polygons are trimmed so that each location keeps the thickest band covering it.
 
-    #medium thickness areas
-    zone_2_buildings_min = Thickness_buildings.loc[Thickness_buildings['min_thick'] >= 10]
-    zone_2_buildings_volume_min = zone_2_buildings_min['volume_min'].sum()
-    zone_2_roads_min = Thickness_roads.loc[Thickness_roads['min_thick']>=10]
-    zone_2_roads_volume_min = zone_2_roads_min['volume_min'].sum()
+        Arguments:
+            isopach (GeoDataFrame): Isopach polygons with "min_thick" and "max_thick" columns
+        Returns:
+             bands (GeoSeries): Non-overlapping band geometries, in the same order and CRS as the isopach
+    """
+    import geopandas as gpd
+
+    geometries = list(isopach.geometry)
+    covered = None
+    for i in np.argsort(-isopach['max_thick'].to_numpy(dtype=float), kind="stable"):
+        geometry = geometries[i]
+        if covered is None:
+            covered = geometry
+        else:
+            geometries[i] = geometry.difference(covered)
+            covered = covered.union(geometry)
+    return gpd.GeoSeries(geometries, crs=isopach.crs)
+
+
+def assign_isopach_bands(features, bands, measure="area", method="centroid"):
+    """
+    Assigns buildings or road segments to isopach bands using spatial indexes (STR-trees).
+
+        Arguments:
+            features (GeoSeries): Projected building footprints or road edges
+            bands (GeoSeries): Non-overlapping isopach bands in the same CRS, from disjoint_isopach_bands
+            measure (str): "area" for building footprints or "length" for road edges. Used to split features which
+            straddle bands when method="area_weighted"
+            method (str): "centroid" assigns each feature to the one band containing its representative point.
+            "area_weighted" splits each feature across the bands it intersects in proportion to its area or length
+            within each band
+        Returns:
+             (feature, band, weight) (tuple): Arrays giving the position of the feature, the position of the band and
+             the share of the feature within that band for every feature-band pair
+    """
+    if method == "centroid":
+        # Querying the few band polygons against a tree of the many points tests each band once as a prepared
+        # geometry, instead of testing every point against the unprepared band polygons
+        band, feature = features.representative_point().sindex.query(bands.values, predicate="intersects")
+        feature, first = np.unique(feature, return_index=True)
+        return feature, band[first], np.ones(len(feature))
+    elif method == "area_weighted":
+        feature, band = bands.sindex.query(features.values, predicate="intersects")
+        geometries = features.values[feature]
+        pieces = geometries.intersection(bands.values[band])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if measure == "length":
+                weight = np.nan_to_num(pieces.length / geometries.length)
+            else:
+                weight = np.nan_to_num(pieces.area / geometries.area)
+        keep = weight > 0
+        return feature[keep], band[keep], weight[keep]
+    raise ValueError("method must be 'centroid' or 'area_weighted'")
+
+
+def get_isopach_band_assignment(key, FP_area_UTM, road_UTM, bands, method="centroid"):
+    """
+    Obtains the isopach band assignment of buildings and road segments. Assignments are stored alongside the cached
+    exposure data, keyed on the band geometries only, so that re-running with changed band thicknesses does not repeat
+    the overlay.
+
+        Arguments:
+            key (str): Exposure cache key of the buildings and roads
+            FP_area_UTM (GeoDataFrame): Projected building footprints
+            road_UTM (GeoDataFrame): Projected road edges
+            bands (GeoSeries): Non-overlapping isopach bands in the same CRS, from disjoint_isopach_bands
+            method (str): "centroid" or "area_weighted", see assign_isopach_bands
+        Returns:
+             (building_bands, road_bands) (tuple): (feature, band, weight) arrays for buildings and for roads
+    """
+    band_key = hashlib.sha1(("".join(band.wkb_hex for band in bands) + method).encode("UTF-8")).hexdigest()
+    path = os.path.join(_exposure_cache_paths(key)[0], "bands_" + band_key + ".npz")
+    with _stage("overlay") as record:
+        record["features"] = len(FP_area_UTM) + len(road_UTM)
+        if os.path.exists(path):
+            record["bytes_read"] = os.path.getsize(path)
+            with np.load(path) as assignment:
+                return ((assignment["building_feature"], assignment["building_band"], assignment["building_weight"]),
+                        (assignment["road_feature"], assignment["road_band"], assignment["road_weight"]))
+        building_bands = assign_isopach_bands(FP_area_UTM.geometry, bands, measure="area", method=method)
+        road_bands = assign_isopach_bands(road_UTM.geometry, bands, measure="length", method=method)
+        if os.path.exists(os.path.dirname(path)):
+            staging_path = _staging_path(path) + ".npz"
+            np.savez(staging_path, building_feature=building_bands[0], building_band=building_bands[1],
+                     building_weight=building_bands[2], road_feature=road_bands[0], road_band=road_bands[1],
+                     road_weight=road_bands[2])
+            os.replace(staging_path, path)
+            record["bytes_written"] = os.path.getsize(path)
+    return building_bands, road_bands
+
+
+def isopach_band_volumes(building_area, road_area, isopach, building_bands, road_bands):
+    """
+    Calculates the minimum and maximum volume of tephra requiring clean-up within each isopach band from a band
+    assignment. Only the band thicknesses are needed, so this is cheap to repeat for changed thicknesses.
 
-    zone_2_buildings_max = Thickness_buildings.loc[Thickness_buildings['max_thick'] >= 10]
-    zone_2_buildings_volume_max = zone_2_buildings_max['volume_max'].sum()
-    zone_2_roads_max = Thickness_roads.loc[Thickness_roads['max_thick']>=10]
-    zone_2_roads_volume_max = zone_2_roads_max['volume_max'].sum()
+        Arguments:
+            building_area (ndarray): Footprint area of each building in square metres
+            road_area (ndarray): Area of each road segment in square metres
+            isopach (GeoDataFrame): Isopach with "min_thick" and "max_thick" columns in mm
+            building_bands (tuple): (feature, band, weight) arrays for buildings from get_isopach_band_assignment
+            road_bands (tuple): (feature, band, weight) arrays for roads from get_isopach_band_assignment
+        Returns:
+             Band_volumes (DataFrame): Thickness range and minimum and maximum clean-up volume in cubic metres of
+             each isopach band
+    """
+    with _stage("band_volumes") as record:
+        record["features"] = len(building_bands[0]) + len(road_bands[0])
+        building_volume, road_volume = isopach_feature_volumes(building_area, road_area, isopach, building_bands,
+                                                               road_bands)
+        Band_volumes = pd.DataFrame({"min_thick": isopach['min_thick'].to_numpy(dtype=float),
+                                     "max_thick": isopach['max_thick'].to_numpy(dtype=float)}, index=isopach.index)
+        for i, column in enumerate(("volume_min", "volume_max")):
+            Band_volumes[column] = (np.bincount(building_bands[1], building_volume[:, i], minlength=len(isopach)) +
+                                    np.bincount(road_bands[1], road_volume[:, i], minlength=len(isopach)))
+    return Band_volumes
+
+
+def isopach_feature_volumes(building_area, road_area, isopach, building_bands, road_bands):
+    """
+    Calculates the minimum and maximum volume of tephra requiring clean-up for every feature-band pair of a band
+    assignment.
+
+        Arguments:
+            building_area (ndarray): Footprint area of each building in square metres
+            road_area (ndarray): Area of each road segment in square metres
+            isopach (GeoDataFrame): Isopach with "min_thick" and "max_thick" columns in mm
+            building_bands (tuple): (feature, band, weight) arrays for buildings from get_isopach_band_assignment
+            road_bands (tuple): (feature, band, weight) arrays for roads from get_isopach_band_assignment
+        Returns:
+             (building_volume, road_volume) (tuple): Arrays of shape (pairs, 2) with the minimum and maximum clean-up
+             volume in cubic metres of each building-band and road-band pair
+    """
+    building_area = np.asarray(building_area, dtype=float)[building_bands[0]] * building_bands[2]
+    road_area = np.asarray(road_area, dtype=float)[road_bands[0]] * road_bands[2]
+    building_volume = np.empty((len(building_area), 2))
+    road_volume = np.empty((len(road_area), 2))
+    for i, (thickness, uncertainty) in enumerate((("min_thick", -0.1), ("max_thick", 0.1))):
+        band_thickness = isopach[thickness].to_numpy(dtype=float)
+        building, road = feature_cleanup_volumes(building_area, band_thickness[building_bands[1]], road_area,
+                                                 band_thickness[road_bands[1]])
+        building_volume[:, i] = building + (building * uncertainty)
+        road_volume[:, i] = road + (road * uncertainty)
+    return building_volume, road_volume
+
+
+def iter_isopach_tiles(footprint, tile_size):
+    """
+    Splits an isopach footprint into a grid of square tiles.
 
+        Arguments:
+            footprint (Polygon): Dissolved isopach footprint in WGS84
+            tile_size (float): Width of the tiles in metres
+        Returns:
+             tiles (generator): Yields (tile, square, crs) for every tile intersecting the footprint, where tile is the
+             part of the footprint within the tile in WGS84 and square is the full tile in the projected crs
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
 
-    zone_2_volume_min = (zone_2_buildings_volume_min + (zone_2_roads_volume_min*2)) - ((zone_2_buildings_volume_min + (zone_2_roads_volume_min*2))*0.1)
-    zone_2_volume_max = (zone_2_buildings_volume_max + (zone_2_roads_volume_max*2)) + ((zone_2_buildings_volume_max + (zone_2_roads_volume_max*2))*0.1)
+    # Projected with geopandas rather than OSMnX, so that runs reading an OSM extract do not have to import OSMnX
+    footprint = gpd.GeoSeries([footprint], crs="EPSG:4326")
+    crs = utm_crs(footprint)
+    footprint_UTM = footprint.to_crs(crs).iloc[0]
+    minx, miny, maxx, maxy = footprint_UTM.bounds
+    for x in np.arange(minx, maxx, tile_size):
+        for y in np.arange(miny, maxy, tile_size):
+            square = box(x, y, x + tile_size, y + tile_size)
+            tile = square.intersection(footprint_UTM)
+            if tile.area > 0:
+                yield gpd.GeoSeries([tile], crs=crs).to_crs("EPSG:4326").iloc[0], square, crs
 
-    #Low thickness areas
-    zone_3_roads_min = Thickness_roads.loc[Thickness_roads['min_thick']>=0.5]
-    zone_3_roads_volume_min = zone_3_roads_min['volume_min'].sum()
-    zone_3_volume_min = (zone_3_roads_volume_min + (zone_3_roads_volume_min *0.1))
 
-    zone_3_roads_max = Thickness_roads.loc[Thickness_roads['max_thick'] >= 0.5]
-    zone_3_roads_volume_max = zone_3_roads_max['volume_max'].sum()
-    zone_3_volume_max = (zone_3_roads_volume_max + (zone_3_roads_volume_max * 0.1))
+def _owned_by_tile(features, square, crs):
+    points = features.representative_point().to_crs(crs)
+    minx, miny, maxx, maxy = square.bounds
+    return ((points.x >= minx) & (points.x < maxx) & (points.y >= miny) & (points.y < maxy)).to_numpy()
 
 
-    zone_3_volume_max = (zone_3_roads_volume_max + (zone_3_roads_volume_max *0.1))
+# Width in metres of the tiles used by tephra_cleanup_volume_from_isopach(..., lean=True)
+LEAN_TILE_SIZE = 20000
 
-    cleanup_volume_min = zone_1_volume_min + zone_2_volume_min + zone_3_volume_min
-    cleanup_volume_max = zone_1_volume_max + zone_2_volume_max + zone_3_volume_max
 
-    # --- Monte Carlo analysis ---
-    Thickness = []
-    Area = []
-    Volume = []
-    # Dollars=[]
-    # Duration=[]
-
-    N = 10000
-    print("Calculating tephra volume requiring clean-up.")
-    for i in range(N):
-        DVolume = ((random.uniform((cleanup_volume_min), (cleanup_volume_max))))
-        # DDollars =((random.randint(Min_cost_per_m3, Max_cost_per_m3)*DVolume)/1000)
-        # DDuration =((DVolume/(random.randint(Min_truck_size_m3, Max_truck_size_m3)))*
-        # (random.randint(Min_disposal_time_mins,Max_disposal_time_mins)/(random.randint(Min_trucks, Max_trucks)))/
-        # (random.randint(Min_hrs_day, Max_hrs_day)*60))
-
-        Volume = Volume + [DVolume]
-        # Dollars=Dollars+[DDollars]
-        # Duration=Duration+[DDuration]
-
-    num_bins = 50
-
-    df = pd.DataFrame(Volume)
-    print(df.describe())
-
-    Percentile_50 = stats.scoreatpercentile(Volume, 50)
-    Percentile_10 = stats.scoreatpercentile(Volume, 10)
-    Percentile_90 = stats.scoreatpercentile(Volume, 90)
-    CleanUpVolume = pd.DataFrame([[name, Percentile_10, Percentile_50, Percentile_90]],
-                                 columns=["Place",
-                                          "10th Percentile",
-                                          "50th Percentile",
-                                          "90th Percentile"])
-    print(CleanUpVolume)
+def iter_isopach_tile_volumes(isopach, tile_size, osm_date=None, use_cache=True, overlay="centroid", pbf=None,
+                              road_widths=None, grid=None):
+    """
+    Streams the clean-up volume of each isopach band tile by tile, so that only the exposure data of one tile is held
+    in memory at a time. Buildings and road segments crossing tile edges are counted only in the tile containing their
+    representative point.
+
+        Arguments:
+            isopach (GeoDataFrame): Isopach polygons with "min_thick" and "max_thick" columns
+            tile_size (float): Width of the tiles in metres
+            osm_date (str): OSM snapshot date. None uses the latest data
+            use_cache (Bool): Defines whether exposure data are loaded from the local cache when available
+            overlay (str): "centroid" or "area_weighted", see assign_isopach_bands
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+            road_widths (dict): Width in metres of each highway type, see road_width. None gives every road a width
+            of 3 m
+            grid (float, tuple or GeoDataFrame): Grid to aggregate the volumes of each tile onto, see grid_volumes.
+            The grid of each tile is stored in Tile_volumes.attrs["grid"]. Defaults to None
+        Returns:
+             Tile_volumes (generator): Yields the Band_volumes DataFrame of each tile. Tiles without any buildings or
+             roads (e.g. over the sea) have zero volume and no grid
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    bands = None
+    for tile, square, crs in iter_isopach_tiles(_isopach_footprint(isopach), tile_size):
+        if bands is None:
+            # The bands are trimmed once for the whole isopach, in the crs the tiles are laid out in
+            bands = disjoint_isopach_bands(isopach.to_crs(crs))
+        FP_area_UTM, road_UTM = get_exposure(tile, osm_date=osm_date, use_cache=use_cache, truncate_by_edge=True,
+                                             pbf=pbf)
+        if not len(FP_area_UTM) and not len(road_UTM):
+            logger.warning("No buildings or roads in the tile at %s, it is given zero volume", square.bounds)
+            no_features = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+            yield isopach_band_volumes(np.zeros(0), np.zeros(0), isopach, no_features, no_features)
+            continue
+        compute_surface_areas(FP_area_UTM, road_UTM, road_widths=road_widths)
+        # Only the bands around the tile's features are overlaid. Features crossing the tile edge are covered too, so
+        # that area weighted overlays see all of them. Bands keep their positions, with empty geometries elsewhere
+        bounds = np.vstack([layer.total_bounds for layer in (FP_area_UTM, road_UTM) if len(layer)])
+        extent = gpd.GeoSeries([box(*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))], crs=road_UTM.crs)
+        extent = extent.buffer(tile_size / 10).to_crs(crs).union(gpd.GeoSeries([square], crs=crs))
+        tile_bands = bands.clip_by_rect(*extent.total_bounds).to_crs(road_UTM.crs)
+        building_bands, road_bands = get_isopach_band_assignment(
+            exposure_cache_key(tile, osm_date=osm_date, truncate_by_edge=True, pbf=pbf), FP_area_UTM, road_UTM,
+            tile_bands, method=overlay)
+        building_owned = _owned_by_tile(FP_area_UTM.geometry, square, crs)[building_bands[0]]
+        road_owned = _owned_by_tile(road_UTM.geometry, square, crs)[road_bands[0]]
+        building_bands = tuple(array[building_owned] for array in building_bands)
+        road_bands = tuple(array[road_owned] for array in road_bands)
+        Tile_volumes = isopach_band_volumes(FP_area_UTM['area'], road_UTM['area'], isopach, building_bands,
+                                            road_bands)
+        if grid is not None:
+            # Tiles may fall in different UTM zones, so every tile is binned in the crs of the whole footprint
+            Tile_volumes.attrs["grid"] = isopach_grid_volumes(FP_area_UTM, road_UTM, isopach, building_bands,
+                                                              road_bands, grid, crs=crs)
+        # Free the geometries of this tile before the next tile is read, rather than holding two tiles at once
+        del FP_area_UTM, road_UTM
+        yield Tile_volumes
+
+
+def tiled_isopach_band_volumes(isopach, tile_size, osm_date=None, use_cache=True, overlay="centroid", pbf=None,
+                               road_widths=None, grid=None):
+    """
+    Calculates the clean-up volume of each isopach band by accumulating the volumes of each tile in turn. Used for
+    isopachs covering whole regions, where a single OSM request would time out or exhaust memory.
+
+        Arguments:
+            isopach (GeoDataFrame): Isopach polygons with "min_thick" and "max_thick" columns
+            tile_size (float): Width of the tiles in metres
+            osm_date (str): OSM snapshot date. None uses the latest data
+            use_cache (Bool): Defines whether exposure data are loaded from the local cache when available
+            overlay (str): "centroid" or "area_weighted", see assign_isopach_bands
+            pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+            road_widths (dict): Width in metres of each highway type, see road_width. None gives every road a width
+            of 3 m
+            grid (float, tuple or GeoDataFrame): Grid to aggregate the volumes onto, see grid_volumes. The combined
+            grid of all tiles is stored in Band_volumes.attrs["grid"]. Defaults to None
+        Returns:
+             Band_volumes (DataFrame): Thickness range and minimum and maximum clean-up volume in cubic metres of
+             each isopach band
+    """
+    Band_volumes = None
+    Grids = []
+    for i, Tile_volumes in enumerate(iter_isopach_tile_volumes(isopach, tile_size, osm_date=osm_date,
+                                                               use_cache=use_cache, overlay=overlay, pbf=pbf,
+                                                               road_widths=road_widths, grid=grid)):
+        logger.info("Processed tile %s", i + 1)
+        if "grid" in Tile_volumes.attrs:
+            Grids.append(Tile_volumes.attrs.pop("grid"))
+        if Band_volumes is None:
+            Band_volumes = Tile_volumes
+        else:
+            Band_volumes[["volume_min", "volume_max"]] += Tile_volumes[["volume_min", "volume_max"]]
+    if Grids:
+        Band_volumes.attrs["grid"] = combine_grid_volumes(Grids)
+    return Band_volumes
+
+
+class IsopachState:
+    """
+    Keeps the exposure data and band assignment of an isopach between runs, so that updated isopachs of an ongoing
+    eruption only fetch exposure data for newly covered areas and only re-assign features in bands that changed.
+    Pass the same IsopachState to tephra_cleanup_volume_from_isopach with each updated isopach.
+
+        Attributes:
+            footprint (Polygon): Area covered by the exposure data so far, in WGS84
+            FP_area_UTM (GeoDataFrame): Projected building footprints with an "area" column
+            road_UTM (GeoDataFrame): Projected road edges with "length" and "area" columns
+            bands (GeoSeries): Non-overlapping isopach bands of the last run
+            building_bands (tuple): (feature, band, weight) arrays for buildings, see assign_isopach_bands
+            road_bands (tuple): (feature, band, weight) arrays for roads
+            Band_volumes (DataFrame): Clean-up volume of each isopach band of the last run
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.footprint = None
+        self.FP_area_UTM = None
+        self.road_UTM = None
+        self.bands = None
+        self.building_bands = None
+        self.road_bands = None
+        self.Band_volumes = None
+        self.settings = None
+
+    def update(self, isopach, osm_date=None, use_cache=True, overlay="centroid", pbf=None, road_widths=None):
+        """
+        Updates the exposure data, band assignment and band volumes for a new isopach.
+
+            Arguments:
+                isopach (GeoDataFrame): Isopach polygons with "min_thick" and "max_thick" columns
+                osm_date (str): OSM snapshot date. None uses the latest data
+                use_cache (Bool): Defines whether exposure data are loaded from the local cache when available
+                overlay (str): "centroid" or "area_weighted", see assign_isopach_bands
+                pbf (str): Path to a local .osm.pbf extract to read instead of querying Overpass. Defaults to None
+                road_widths (dict): Width in metres of each highway type, see road_width. None gives every road a
+                width of 3 m
+            Returns:
+                 Band_volumes (DataFrame): Thickness range and minimum and maximum clean-up volume in cubic metres of
+                 each isopach band
+        """
+        import geopandas as gpd
+
+        if self.settings != (osm_date, overlay, pbf, road_widths):
+            self.reset()
+            self.settings = (osm_date, overlay, pbf, road_widths)
+        footprint = _isopach_footprint(isopach)
+        new_area = footprint if self.footprint is None else footprint.difference(self.footprint)
+
+        n_buildings = 0 if self.FP_area_UTM is None else len(self.FP_area_UTM)
+        n_roads = 0 if self.road_UTM is None else len(self.road_UTM)
+        if not new_area.is_empty:
+            logger.info("Obtaining exposure data for the newly covered area")
+            FP_area_UTM, road_UTM = get_exposure(new_area, osm_date=osm_date, use_cache=use_cache,
+                                                 truncate_by_edge=True, pbf=pbf)
+            compute_surface_areas(FP_area_UTM, road_UTM, road_widths=road_widths)
+            if self.footprint is None:
+                self.FP_area_UTM = FP_area_UTM.to_crs(road_UTM.crs)
+                self.road_UTM = road_UTM
+            else:
+                # Features touching the previous footprint were already obtained with it
+                crs = self.road_UTM.crs
+                previous = gpd.GeoSeries([self.footprint], crs="EPSG:4326").to_crs(crs).iloc[0]
+                self.FP_area_UTM = pd.concat([self.FP_area_UTM, self._outside(FP_area_UTM.to_crs(crs), previous)],
+                                             ignore_index=True)
+                self.road_UTM = pd.concat([self.road_UTM, self._outside(road_UTM.to_crs(crs), previous)],
+                                          ignore_index=True)
+            self.footprint = footprint if self.footprint is None else self.footprint.union(footprint)
+
+        isopach = isopach.to_crs(self.road_UTM.crs)
+        bands = disjoint_isopach_bands(isopach)
+        with _stage("overlay") as record:
+            if self.bands is None or len(self.bands) != len(bands):
+                changed = None
+            else:
+                changed = [old.symmetric_difference(new) for old, new in zip(self.bands.values, bands.values)
+                           if not old.equals(new)]
+            self.building_bands = self._reassign(self.FP_area_UTM, self.building_bands, n_buildings, bands, changed,
+                                                 "area", overlay)
+            self.road_bands = self._reassign(self.road_UTM, self.road_bands, n_roads, bands, changed, "length",
+                                             overlay)
+            record["features"] = len(self.FP_area_UTM) + len(self.road_UTM)
+        self.bands = bands
+        self.Band_volumes = isopach_band_volumes(self.FP_area_UTM['area'], self.road_UTM['area'], isopach,
+                                                 self.building_bands, self.road_bands)
+        return self.Band_volumes
+
+    @staticmethod
+    def _outside(features, polygon):
+        outside = np.ones(len(features), dtype=bool)
+        outside[features.sindex.query(polygon, predicate="intersects")] = False
+        return features.iloc[outside]
+
+    @staticmethod
+    def _reassign(features, assignment, n_previous, bands, changed, measure, overlay):
+        # Features obtained for the newly covered area, and features in any area whose band changed, are re-assigned
+        if assignment is None or changed is None:
+            return assign_isopach_bands(features.geometry, bands, measure=measure, method=overlay)
+        redo = np.arange(n_previous, len(features))
+        for region in changed:
+            redo = np.union1d(redo, features.sindex.query(region, predicate="intersects"))
+        logger.info("Re-assigning %s of %s features to isopach bands", len(redo), len(features))
+        if len(redo) == 0:
+            return assignment
+        keep = ~np.isin(assignment[0], redo)
+        feature, band, weight = assign_isopach_bands(features.geometry.iloc[redo], bands, measure=measure,
+                                                     method=overlay)
+        return (np.concatenate([assignment[0][keep], redo[feature]]), np.concatenate([assignment[1][keep], band]),
+                np.concatenate([assignment[2][keep], weight]))
+
+
+# --- Volume grids ---
+def _grid_cells(x, y, cell_size, shape):
+    # Integer (column, row) of the square or pointy-top hexagonal cell containing each point
+    if shape == "square":
+        return np.floor(x / cell_size).astype(np.int64), np.floor(y / cell_size).astype(np.int64)
+    elif shape == "hex":
+        size = cell_size / np.sqrt(3)
+        q = (np.sqrt(3) / 3 * x - y / 3) / size
+        r = (2 / 3 * y) / size
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        rq = np.where((dq > dr) & (dq > ds), -rr - rs, rq)
+        rr = np.where(~((dq > dr) & (dq > ds)) & (dr > ds), -rq - rs, rr)
+        return rq.astype(np.int64), rr.astype(np.int64)
+    raise ValueError("shape must be 'square' or 'hex'")
+
+
+def _grid_cell_polygons(col, row, cell_size, shape):
+    from shapely.geometry import Polygon, box
+
+    if shape == "square":
+        return [box(c * cell_size, r * cell_size, (c + 1) * cell_size, (r + 1) * cell_size) for c, r in zip(col, row)]
+    size = cell_size / np.sqrt(3)
+    angles = np.radians(30 + 60 * np.arange(6))
+    x = size * (np.sqrt(3) * col + np.sqrt(3) / 2 * row)
+    y = size * 1.5 * row
+    return [Polygon(np.column_stack([cx + size * np.cos(angles), cy + size * np.sin(angles)])) for cx, cy in zip(x, y)]
+
+
+def grid_volumes(points, volumes, grid):
+    """
+    Aggregates the clean-up volume of individual buildings and road segments onto a square or hexagonal grid, or onto
+    polygons such as suburbs. Points are binned with array arithmetic (or the spatial index for polygons) and summed
+    with bincount, so only the occupied cells are ever built.
+
+        Arguments:
+            points (GeoSeries): Projected location of each feature
+            volumes (ndarray): Array of shape (len(points), 2) with the minimum and maximum clean-up volume of each
+            feature in cubic metres
+            grid (float, tuple or GeoDataFrame): Distance in metres between the centres of neighbouring square cells,
+            a ("square", size) or ("hex", size) tuple, or polygons to aggregate the volumes within
+        Returns:
+             Grid (GeoDataFrame): Minimum and maximum clean-up volume in cubic metres of every cell containing
+             tephra requiring clean-up. Grid cells are indexed by (col, row) and polygons keep their own index. The
+             shape and size of grid cells are kept in Grid.attrs["grid"]
+    """
+    import geopandas as gpd
+
+    volumes = np.asarray(volumes, dtype=float).reshape(-1, 2)
+    if isinstance(grid, gpd.GeoDataFrame):
+        polygons = grid.to_crs(points.crs)
+        polygon, point = points.sindex.query(polygons.geometry.values, predicate="intersects")
+        point, first = np.unique(point, return_index=True)
+        polygon = polygon[first]
+        occupied = np.unique(polygon)
+        Grid = gpd.GeoDataFrame({"volume_min": np.bincount(polygon, volumes[point, 0], len(polygons))[occupied],
+                                 "volume_max": np.bincount(polygon, volumes[point, 1], len(polygons))[occupied]},
+                                geometry=polygons.geometry.values[occupied], index=polygons.index[occupied],
+                                crs=points.crs)
+        return Grid
+    shape, cell_size = grid if isinstance(grid, tuple) else ("square", grid)
+    col, row = _grid_cells(points.x.to_numpy(), points.y.to_numpy(), cell_size, shape)
+    cells, cell = np.unique(np.column_stack([col, row]), axis=0, return_inverse=True)
+    cell = cell.reshape(-1)
+    Grid = gpd.GeoDataFrame({"volume_min": np.bincount(cell, volumes[:, 0], len(cells)),
+                             "volume_max": np.bincount(cell, volumes[:, 1], len(cells))},
+                            geometry=_grid_cell_polygons(cells[:, 0], cells[:, 1], cell_size, shape),
+                            index=pd.MultiIndex.from_arrays([cells[:, 0], cells[:, 1]], names=["col", "row"]),
+                            crs=points.crs)
+    Grid.attrs["grid"] = (shape, float(cell_size))
+    return Grid
+
+
+def isopach_grid_volumes(FP_area_UTM, road_UTM, isopach, building_bands, road_bands, grid, crs=None):
+    """
+    Calculates the clean-up volume of each cell of a grid from an isopach band assignment. Each building and road
+    segment is placed at its centroid.
+
+        Arguments:
+            FP_area_UTM (GeoDataFrame): Projected building footprints with an "area" column
+            road_UTM (GeoDataFrame): Projected road edges with an "area" column
+            isopach (GeoDataFrame): Isopach with "min_thick" and "max_thick" columns in mm, in the same crs
+            building_bands (tuple): (feature, band, weight) arrays for buildings from get_isopach_band_assignment
+            road_bands (tuple): (feature, band, weight) arrays for roads from get_isopach_band_assignment
+            grid (float, tuple or GeoDataFrame): Grid cell size, ("hex", size) or polygons, see grid_volumes
+            crs (str or CRS): Projected crs the grid is laid out in. Defaults to the crs of the roads. Grids which are
+            combined later, e.g. those of isopach tiles, must share one crs
+        Returns:
+             Grid (GeoDataFrame): Minimum and maximum clean-up volume in cubic metres of every occupied cell
+    """
+    import geopandas as gpd
+
+    with _stage("grid") as record:
+        building_volume, road_volume = isopach_feature_volumes(FP_area_UTM['area'], road_UTM['area'], isopach,
+                                                               building_bands, road_bands)
+        points = gpd.GeoSeries(np.concatenate([FP_area_UTM.geometry.centroid.values[building_bands[0]],
+                                               road_UTM.geometry.centroid.values[road_bands[0]]]),
+                               crs=road_UTM.crs)
+        if crs is not None:
+            points = points.to_crs(crs)
+        Grid = grid_volumes(points, np.concatenate([building_volume, road_volume]), grid)
+        record["features"] = len(points)
+    return Grid
+
+
+def combine_grid_volumes(Grids):
+    """
+    Sums grids of clean-up volumes calculated separately, e.g. for each tile of a large isopach.
+
+        Arguments:
+            Grids (list): GeoDataFrames from grid_volumes with the same grid and crs
+        Returns:
+             Grid (GeoDataFrame): Minimum and maximum clean-up volume in cubic metres of every occupied cell
+    """
+    import geopandas as gpd
+
+    Grid = pd.concat(Grids)
+    levels = list(range(Grid.index.nlevels))
+    volumes = Grid[["volume_min", "volume_max"]].groupby(level=levels).sum()
+    geometry = Grid.geometry.groupby(level=levels).first()
+    Grid = gpd.GeoDataFrame(volumes, geometry=geometry.values, crs=Grids[0].crs)
+    Grid.attrs = dict(Grids[0].attrs)
+    return Grid
+
+
+def write_volume_grid(Grid, path):
+    """
+    Writes a grid of clean-up volumes to GeoParquet, or to a two band (minimum and maximum volume) GeoTIFF for square
+    grids when the path ends in .tif. Requires rasterio for GeoTIFFs. Raises ValueError when a hexagonal or polygon
+    grid is written to a GeoTIFF.
+
+        Arguments:
+            Grid (GeoDataFrame): Grid from grid_volumes
+            path (str): Output path
+    """
+    if not path.lower().endswith((".tif", ".tiff")):
+        Grid.reset_index().to_parquet(path)
+        return
+    shape, cell_size = Grid.attrs.get("grid", (None, None))
+    if shape != "square":
+        raise ValueError("Only square grids can be written to a GeoTIFF. Write hexagonal and polygon grids to "
+                         "GeoParquet instead")
+    try:
+        import rasterio
+        from rasterio.transform import from_origin
+    except ImportError:
+        raise ImportError("rasterio is required to write the volume grid as a GeoTIFF")
+    col = Grid.index.get_level_values("col").to_numpy()
+    row = Grid.index.get_level_values("row").to_numpy()
+    data = np.zeros((2, row.max() - row.min() + 1, col.max() - col.min() + 1), dtype="float32")
+    data[:, row.max() - row, col - col.min()] = Grid[["volume_min", "volume_max"]].to_numpy().T
+    with rasterio.open(path, "w", driver="GTiff", height=data.shape[1], width=data.shape[2], count=2,
+                       dtype="float32", crs=Grid.crs, compress="deflate",
+                       transform=from_origin(col.min() * cell_size, (row.max() + 1) * cell_size, cell_size,
+                                             cell_size)) as dst:
+        dst.write(data)
+
+
+# --- Results ---
+class CleanupResult:
+    """
+    Results of a clean-up run.
+
+        Arguments:
+            name (str): Name of the place, area or isopach modelled
+            percentiles (dict): 10th, 50th and 90th percentile of the volume of tephra requiring removal in cubic
+            metres, keyed on 10, 50 and 90
+            samples (ndarray): Monte Carlo samples of the clean-up volume in cubic metres, or None in summary mode
+            breakdown (DataFrame): Surface areas and clean-up volumes behind the result, e.g. per isopach band
+            metrics (RunMetrics): Timing and memory of each stage of the run
+            cost (dict): 10th, 50th and 90th percentile of the clean-up cost, or None if no resources were given
+            duration (dict): 10th, 50th and 90th percentile of the number of days needed for clean-up, or None
+            cost_samples (ndarray): Monte Carlo samples of the clean-up cost, paired with the volume samples
+            duration_samples (ndarray): Monte Carlo samples of the clean-up duration in days
+            grid (GeoDataFrame): Minimum and maximum clean-up volume of each grid cell or polygon, see grid_volumes
+            convergence (DataFrame): Percentiles estimated from increasing numbers of samples, see
+            percentile_convergence. None when the percentiles are exact (sampling="analytic") or in summary mode
+    """
+    def __init__(self, name, percentiles, samples=None, breakdown=None, metrics=None, cost=None, duration=None,
+                 cost_samples=None, duration_samples=None, grid=None, convergence=None):
+        self.name = name
+        self.percentiles = percentiles
+        self.samples = samples
+        self.breakdown = breakdown
+        self.metrics = metrics
+        self.cost = cost
+        self.duration = duration
+        self.cost_samples = cost_samples
+        self.duration_samples = duration_samples
+        self.grid = grid
+        self.convergence = convergence
+
+    @property
+    def p10(self):
+        return self.percentiles[10]
+
+    @property
+    def p50(self):
+        return self.percentiles[50]
+
+    @property
+    def p90(self):
+        return self.percentiles[90]
+
+    def to_frame(self):
+        """
+        Returns:
+             CleanUpVolume (DataFrame): One row with the 10th, 50th and 90th percentile of the clean-up volume, and
+             of the cost and duration when they were modelled
+        """
+        CleanUpVolume = pd.DataFrame([[self.name, self.p10, self.p50, self.p90]],
+                                     columns=["Place", "10th Percentile", "50th Percentile", "90th Percentile"])
+        for label, percentiles in (("Cost", self.cost), ("Duration", self.duration)):
+            if percentiles is not None:
+                for q in (10, 50, 90):
+                    CleanUpVolume["{} {}th Percentile".format(label, q)] = percentiles[q]
+        return CleanUpVolume
+
+    def __repr__(self):
+        return "CleanupResult({!r}, P10={:,.1f}, P50={:,.1f}, P90={:,.1f})".format(self.name, self.p10, self.p50,
+                                                                                  self.p90)
+
+
+# --- Figures ---
+# Directory the csv files and figures of the clean-up functions are written to, relative to the working directory
+RESULTS_DIR = "Results"
+FIGURE_BINS = 50
+FIGURE_CDF_POINTS = 1000
+
+
+def volume_figure_data(Volume, bins=FIGURE_BINS, cdf_points=FIGURE_CDF_POINTS):
+    """
+    Precomputes the cumulative distribution and histogram of the clean-up volume. Figures are drawn from these few
+    hundred values, so they can be drawn later or in another thread without keeping or re-sorting the samples.
+
+        Arguments:
+            Volume (ndarray): Monte Carlo samples of the clean-up volume in cubic metres
+            bins (int): Number of histogram bins
+            cdf_points (int): Number of points of the cumulative distribution function
+        Returns:
+             data (dict): Volume quantiles ("cdf") at evenly spaced probabilities ("p"), and the bin "edges" and
+             probability "density" of the histogram
+    """
+    Volume = np.asarray(Volume)
+    p = np.linspace(0.0, 1.0, cdf_points)
+    density, edges = np.histogram(Volume, bins=bins, density=True)
+    return {"p": p, "cdf": np.quantile(Volume, p), "edges": edges, "density": density}
+
+
+def _draw_volume_figure(figure, data, title=None):
+    from matplotlib.ticker import FuncFormatter
+
+    formatter = FuncFormatter(lambda x, loc: "{:,}".format(int(x)))
+    ax1 = figure.add_subplot(3, 1, 1)
+    ax1.plot(data["cdf"], data["p"])
+    ax1.set_ylabel('Cumulative density function')
+    ax1.set_yticks([0, 0.25, 0.5, 0.75, 1])
+    ax1.xaxis.set_major_formatter(formatter)
+    if title is not None:
+        ax1.set_title(title)
+
+    ax2 = figure.add_subplot(3, 1, 2)
+    ax2.hist(data["edges"][:-1], bins=data["edges"], weights=data["density"], label="Volume")
+    ax2.set_ylabel('Probability Density')
+    ax2.set_xlabel('Volume [$m^3$]')
+    ax2.legend(loc=0, framealpha=0.5, fontsize=11)
+    ax2.xaxis.set_major_formatter(formatter)
+
+
+class FigureRenderer:
+    """
+    Draws clean-up volume figures with the non-interactive Agg backend, away from the modelling. Pass a renderer as
+    fig= to the clean-up functions (including tephra_cleanup_volume_batch) and the figure of each run is queued
+    instead of shown, so that plotting never blocks a batch. Use it as a context manager, or call close() to wait
+    for the remaining figures.
+
+        Arguments:
+            directory (str): Directory the figures are written to as "<name>_volume.png". Defaults to RESULTS_DIR
+            pdf (str): Path of a multi-page PDF to collect the figures of all runs in, instead of one PNG per run
+            background (Bool): Defines whether figures are drawn in a background thread as runs finish (True) or
+            all together when the renderer is closed (False)
+            dpi (int): Resolution of the PNG figures
+        Attributes:
+            paths (list): Files written so far
+    """
+    def __init__(self, directory=None, pdf=None, background=True, dpi=150):
+        self.directory = RESULTS_DIR if directory is None else directory
+        self.pdf = pdf
+        self.background = background
+        self.dpi = dpi
+        self.paths = []
+        self._pending = []
+        self._executor = None
+        self._pages = None
+
+    def submit(self, name, data):
+        """
+        Queues the figure of one run.
+
+            Arguments:
+                name (str): Name of the run, used as the file name or page title
+                data (dict): Precomputed distribution from volume_figure_data
+        """
+        if self.background:
+            if self._executor is None:
+                # One thread keeps the pages of the PDF in order and matplotlib off the modelling thread
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._pending.append(self._executor.submit(self._render, name, data))
+        else:
+            self._pending.append((name, data))
+
+    def _render(self, name, data):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(8, 8))
+        FigureCanvasAgg(figure)
+        _draw_volume_figure(figure, data, title=name)
+        if self.pdf is not None:
+            if self._pages is None:
+                from matplotlib.backends.backend_pdf import PdfPages
+
+                self._pages = PdfPages(self.pdf)
+                self.paths.append(self.pdf)
+            self._pages.savefig(figure)
+        else:
+            path = os.path.join(self.directory, name + "_volume.png")
+            figure.savefig(path, dpi=self.dpi, bbox_inches="tight")
+            self.paths.append(path)
+
+    def close(self):
+        """
+        Draws or waits for all queued figures and closes the PDF.
+        """
+        try:
+            for pending in self._pending:
+                if self.background:
+                    pending.result()
+                else:
+                    self._render(*pending)
+        finally:
+            self._pending = []
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._pages is not None:
+                self._pages.close()
+                self._pages = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _report_cleanup_volume(place, place_name_save, Volume, fig, csv, has_volume, summary=False, sample_dtype=None,
+                           breakdown=None, Cost=None, Duration=None, percentiles=None):
+    with _stage("report") as record:
+        result = _write_cleanup_volume(place, place_name_save, Volume, fig, csv, has_volume, record, summary, Cost,
+                                       Duration, percentiles)
+    if not summary:
+        result.samples = np.ascontiguousarray(Volume, dtype=sample_dtype)
+        if Cost is not None:
+            result.cost_samples = np.ascontiguousarray(Cost, dtype=sample_dtype)
+            result.duration_samples = np.ascontiguousarray(Duration, dtype=sample_dtype)
+    result.breakdown = breakdown
+    return result
+
+
+def _write_cleanup_volume(place, place_name_save, Volume, fig, csv, has_volume, record, summary=False, Cost=None,
+                          Duration=None, percentiles=None):
+    if not summary:
+        df = pd.DataFrame(Volume)
+        logger.info("\n%s", df.describe())
+
+    if percentiles is None:
+        result = CleanupResult(place, dict(zip((10, 50, 90), np.percentile(Volume, [10, 50, 90]))))
+        if not summary:
+            # Summary mode keeps only the percentiles, so the convergence table is not worth the extra sorting
+            result.convergence = percentile_convergence(Volume)
+            logger.info("Convergence of the percentiles:\n%s", result.convergence)
+    else:
+        result = CleanupResult(place, percentiles)
+    if Cost is not None:
+        Cost_percentiles, Duration_percentiles = np.percentile(np.vstack([Cost, Duration]), [10, 50, 90], axis=1).T
+        result.cost = dict(zip((10, 50, 90), Cost_percentiles))
+        result.duration = dict(zip((10, 50, 90), Duration_percentiles))
+    CleanUpVolume = result.to_frame()
+    logger.info("\n%s", CleanUpVolume)
     if csv==True:
-        path_csv = "Results/" + name + "_" + ".csv"
+        path_csv = os.path.join(RESULTS_DIR, place + "_" + ".csv")
         CleanUpVolume.to_csv(path_csv, index=False)
-        path_temp = "Results/temp/" + name + "_" + ".csv"
+        path_temp = os.path.join(RESULTS_DIR, "temp", place_name_save + "_" + ".csv")
         CleanUpVolume.to_csv(path_temp, index=False)
+        record["bytes_written"] = os.path.getsize(path_csv) + os.path.getsize(path_temp)
     else:
-        print("No csv will be produced because csv=False. If you want a csv, make csv=True")
+        logger.info("No csv will be produced because csv=False. If you want a csv, make csv=True")
 
     # --- plotting the results ---
-    if fig == True:
-        if Percentile_10 > 0:
-            fig1 = plt.figure(figsize=(8, 8))
-
-            ax1 = plt.subplot(3, 1, 1)
-            ax1.plot(np.sort(Volume), np.linspace(0.0, 1.0, len(Volume)))
-            # plt.xlabel('Volume [$m^3$]')
-            plt.ylabel('Cumulative density function')
-            plt.yticks([0, 0.25, 0.5, 0.75, 1])
-            # ax1.axvspan(15000, 45000, alpha=0.5, color='gray')
-            ax1.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            ax2 = plt.subplot(3, 1, 2)
-            ax2.hist(np.sort(Volume), bins=50, density=True, label="Volume")
-            ax2.set_ylabel('Probability Density')
-            ax2.set_xlabel('Volume [$m^3$]')
-            ax2.legend(loc=0, framealpha=0.5, fontsize=11)
-            ax2.get_xaxis().set_major_formatter(plt.FuncFormatter(lambda x, loc: "{:,}".format(int(x))))
-
-            plt.show()
-
-            # fig1.savefig(City_dir + "/" + place + '_volume.png', transparent=True, dpi=300,
-            #              bbox_inches='tight')
-            #plt.close()
+    if isinstance(fig, FigureRenderer) or fig == True:
+        if has_volume:
+            data = volume_figure_data(Volume)
+            if isinstance(fig, FigureRenderer):
+                fig.submit(place_name_save, data)
+            else:
+                import matplotlib.pyplot as plt
+
+                _draw_volume_figure(plt.figure(figsize=(8, 8)), data)
+                plt.show()
         else:
-            print("No ash expected to require removal. No graph will be made")
+            logger.info("No ash expected to require removal. No graph will be made")
     else:
-        print ("No figure will be produced because fig=False. If you want a figure make fig=True")
+        logger.info("No figure will be produced because fig=False. If you want a figure make fig=True")
+
+    return result
+
+def _place_name_save(place):
+    # Name used for the csv and figure files, e.g. "Auckland" for "Auckland, New Zealand"
+    if place.find(",") != -1:
+        return place[:place.index(",")].replace(" ", "")
+    return place.replace(" ", "_")
+
+
+def _sample_cleanup_volume(low, high, N, seed, resources, sampling="monte_carlo"):
+    # Monte Carlo stage shared by the clean-up functions. The volume is the product of independent uniform draws
+    # (clean-up area and thickness, or the volume itself) and the cost and duration are drawn from the same Generator.
+    # The exact percentiles are returned too when sampling="analytic", otherwise None
+    logger.info("Calculating tephra volume requiring clean-up.")
+    rng = np.random.default_rng(seed)
+    with _stage("monte_carlo") as record:
+        Volume = sample_uniform_product(low, high, N=N, seed=rng, sampling=sampling)
+        Percentiles = None
+        if sampling == "analytic":
+            Percentiles = dict(zip((10, 50, 90), uniform_product_quantile(low, high, [0.1, 0.5, 0.9])))
+        Cost = Duration = None
+        if resources is not None:
+            Cost, Duration = cleanup_cost_duration(Volume, resources, seed=rng)
+        record["features"] = len(Volume)
+    return Volume, Cost, Duration, Percentiles
+
+
+def _cleanup_volume_from_query(query, dist, place, min_thickness, max_thickness, fig, csv, N, seed, use_cache,
+                               osm_date, pbf, summary, sample_dtype, road_widths, impervious, resources, sampling):
+    # Pipeline shared by tephra_cleanup_volume_from_place and tephra_cleanup_volume_from_point: surface areas (from
+    # the index, or acquired and projected once), clean-up thresholds, Monte Carlo sampling and reporting
+    logger.info("Initiating tephra clean-up model for %s", place)
+    road_area, impervious_area, fp_area = get_surface_areas(query, dist=dist, osm_date=osm_date, use_cache=use_cache,
+                                                            pbf=pbf, road_widths=road_widths, impervious=impervious)
+    logger.info("Total building footprint area is: %s", fp_area)
 
-    return()
+    # ---------- Cleanup model thresholds ----------
+    logger.info("Initiating clean-up modelling for %s", place)
+    logger.info("Maximum tephra thickness for %s is: %s mm. Minimum  thickness is: %s", place, max_thickness,
+                min_thickness)
+    # Clean-up thresholds
+    logger.info("Determining the appropriate clean-up threshold to use.")
+    with _stage("thresholds"):
+        cleanup_area_min, cleanup_area_max = cleanup_area_thresholds(road_area, impervious_area, fp_area,
+                                                                     max_thickness)
 
-def tephra_cleanup_volume_from_raser (area, raster, fig, csv):
+    # --- Monte Carlo analysis ---
+    Volume, Cost, Duration, Percentiles = _sample_cleanup_volume([cleanup_area_min, min_thickness / 1000],
+                                                                 [cleanup_area_max, max_thickness / 1000], N, seed,
+                                                                 resources, sampling)
+
+    return _report_cleanup_volume(place, _place_name_save(place), Volume, fig, csv, cleanup_area_min > 0,
+                                  summary=summary, sample_dtype=sample_dtype, Cost=Cost, Duration=Duration,
+                                  percentiles=Percentiles,
+                                  breakdown=pd.DataFrame({"road_area": [road_area],
+                                                          "impervious_area": [impervious_area],
+                                                          "fp_area": [fp_area],
+                                                          "cleanup_area_min": [cleanup_area_min],
+                                                          "cleanup_area_max": [cleanup_area_max]}))
+
+
+@_instrumented
+def tephra_cleanup_volume_from_place (place, min_thickness, max_thickness, fig, csv, N=10000, seed=None,
+                                      use_cache=True, osm_date=None, pbf=None, summary=False, sample_dtype=None,
+                                      road_widths=None, impervious=False, resources=None, sampling="monte_carlo"):
+    """
+    This function will estimate the volume of tephra requiring removal as part of municipal clean-up efforts.
+    The function requires the name of the place and the thickness of tephra in mm. The user can specifiy whether a
+    graph and csv file is produced with the model results.
+
+        Arguments:
+            place (str): Name of the place for OSMnX to search the OSM database and collect the exposure data
+            thickness (float): Thickness of tephra in mm to model across the urban area of interest
+            fig (Bool): Defines whether a graph is produced of the model results (True) or not (False). A
+            FigureRenderer draws and saves the graph off the modelling thread instead of showing it
+            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            N (int): Number of Monte Carlo samples to draw. Defaults to 10000 but values of 10^6-10^7 are practical
+            seed (int): Seed for the random number generator so that results can be reproduced. Defaults to None
+            use_cache (Bool): Defines whether exposure data are loaded from the local cache when available (True) or
+            downloaded from OSM again (False)
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z") to model. None uses the latest data
+            pbf (str): Path to a local .osm.pbf extract to read exposure data from instead of querying Overpass.
+            Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM
+            highway, lanes and width tags (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            impervious (Bool): Defines whether the impervious area is obtained from OSM car parks and footpaths (True)
+            or set equal to the road area (False)
+            resources (dict): Distributions of the clean-up cost per cubic metre, truck size, disposal time, number of
+            trucks and working hours per day, see cleanup_cost_duration. When given, the cost and duration of
+            clean-up are sampled with the volume. Defaults to None
+            sampling (str): "monte_carlo" draws N pseudo-random samples. "sobol" draws a scrambled Sobol sequence
+            (requires SciPy) for stable percentiles from far fewer samples. "analytic" calculates the exact
+            percentiles, see uniform_product_quantile. The convergence of sampled percentiles is reported in
+            result.convergence
+            summary (Bool): Defines whether only the percentiles are kept (True), skipping the summary statistics
+            and the sample array, or the Monte Carlo samples are returned too (False)
+            sample_dtype (dtype): Data type of the returned samples, e.g. np.float32 to halve their memory. Defaults
+            to float64
+            callback (function): Called with the timing and memory record of each stage of the run as it finishes.
+            Defaults to None
+        Returns:
+             Result (CleanupResult): Percentiles, Monte Carlo samples and breakdown of the volume of tephra requiring
+             removal in cubic metres, the cost and duration of clean-up, and the metrics of each stage of the run
+    """
+    return _cleanup_volume_from_query(place, None, place, min_thickness, max_thickness, fig, csv, N, seed, use_cache,
+                                      osm_date, pbf, summary, sample_dtype, road_widths, impervious, resources,
+                                      sampling)
+
+@_instrumented
+def tephra_cleanup_volume_from_point (point, buffer, place, min_thickness, max_thickness, fig, csv, N=10000, seed=None,
+                                      use_cache=True, osm_date=None, pbf=None, summary=False, sample_dtype=None,
+                                      road_widths=None, impervious=False, resources=None, sampling="monte_carlo"):
+    """
+    This function will estimate the volume of tephra requiring removal as part of municipal clean-up efforts.
+    The function requires the name of the place and the thickness of tephra in mm. The user can specifiy whether a
+    graph and csv file is produced with the model results.
+
+        Arguments:
+            place (str): Name of the place for OSMnX to search the OSM database and collect the exposure data
+            thickness (float): Thickness of tephra in mm to model across the urban area of interest
+            fig (Bool): Defines whether a graph is produced of the model results (True) or not (False). A
+            FigureRenderer draws and saves the graph off the modelling thread instead of showing it
+            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            N (int): Number of Monte Carlo samples to draw. Defaults to 10000 but values of 10^6-10^7 are practical
+            seed (int): Seed for the random number generator so that results can be reproduced. Defaults to None
+            use_cache (Bool): Defines whether exposure data are loaded from the local cache when available (True) or
+            downloaded from OSM again (False)
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z") to model. None uses the latest data
+            pbf (str): Path to a local .osm.pbf extract to read exposure data from instead of querying Overpass.
+            Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM
+            highway, lanes and width tags (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            impervious (Bool): Defines whether the impervious area is obtained from OSM car parks and footpaths (True)
+            or set equal to the road area (False)
+            resources (dict): Distributions of the clean-up cost per cubic metre, truck size, disposal time, number of
+            trucks and working hours per day, see cleanup_cost_duration. When given, the cost and duration of
+            clean-up are sampled with the volume. Defaults to None
+            sampling (str): "monte_carlo" draws N pseudo-random samples. "sobol" draws a scrambled Sobol sequence
+            (requires SciPy) for stable percentiles from far fewer samples. "analytic" calculates the exact
+            percentiles, see uniform_product_quantile. The convergence of sampled percentiles is reported in
+            result.convergence
+            summary (Bool): Defines whether only the percentiles are kept (True), skipping the summary statistics
+            and the sample array, or the Monte Carlo samples are returned too (False)
+            sample_dtype (dtype): Data type of the returned samples, e.g. np.float32 to halve their memory. Defaults
+            to float64
+            callback (function): Called with the timing and memory record of each stage of the run as it finishes.
+            Defaults to None
+        Returns:
+             Result (CleanupResult): Percentiles, Monte Carlo samples and breakdown of the volume of tephra requiring
+             removal in cubic metres, the cost and duration of clean-up, and the metrics of each stage of the run
+    """
+    return _cleanup_volume_from_query(point, buffer, place, min_thickness, max_thickness, fig, csv, N, seed,
+                                      use_cache, osm_date, pbf, summary, sample_dtype, road_widths, impervious,
+                                      resources, sampling)
+
+@_instrumented
+def tephra_cleanup_volume_from_isopach (name, isopach, fig, csv, N=10000, seed=None,
+                                      use_cache=True, osm_date=None, overlay="centroid", tile_size=None, pbf=None,
+                                      summary=False, sample_dtype=None, state=None, road_widths=None,
+                                      resources=None, grid=None, grid_path=None, sampling="monte_carlo", lean=False):
     """
 
     :param area:
-    :param raster:
-    :param fig:
+    :param isopach:
+    :param fig: whether a graph of the model results is shown, or a FigureRenderer to draw and save it with
     :param csv:
-    :return:
+    :param N: number of Monte Carlo samples to draw
+    :param seed: seed for the random number generator
+    :param use_cache: whether exposure data are loaded from the local cache when available
+    :param osm_date: OSM snapshot date to model, None uses the latest data
+    :param overlay: "centroid" assigns each building and road segment to the one isopach band containing it,
+    "area_weighted" splits features which straddle bands in proportion to their area or length in each band
+    :param tile_size: width in metres of the tiles used to obtain and process exposure data one tile at a time.
+    None processes the whole isopach at once
+    :param state: IsopachState kept between runs with updated isopachs of the same eruption. Only the newly covered
+    area is fetched and only features in bands that changed are re-assigned. Cannot be combined with tile_size
+    :param pbf: path to a local .osm.pbf extract to read exposure data from instead of querying Overpass
+    :param road_widths: width in metres of each highway type used to estimate road widths from the OSM tags (e.g.
+    ROAD_WIDTHS), None gives every road a width of 3 m
+    :param resources: distributions of the clean-up cost per cubic metre, truck size, disposal time, number of
+    trucks and working hours per day, see cleanup_cost_duration. When given, the cost and duration of clean-up are
+    sampled with the volume
+    :param grid: cell size in metres of a square grid, ("hex", size) for a hexagonal grid, or polygons (e.g. suburbs)
+    to map the clean-up volume onto, see grid_volumes. None only gives the volume of each isopach band
+    :param sampling: "monte_carlo", "sobol" (low-discrepancy samples, requires SciPy) or "analytic" (exact percentiles),
+    see sample_uniform_product
+    :param grid_path: path to write the grid to, as GeoParquet or, for square grids, a GeoTIFF when it ends in .tif
+    :param lean: bound memory for isopachs covering whole countries by obtaining and overlaying the exposure data in
+    tiles of LEAN_TILE_SIZE metres (unless tile_size is given), so that only the geometries of one tile are held at
+    a time. This is the tiled pipeline only: with pbf the whole extract is still held in memory, see load_pbf_exposure.
+    Cannot be combined with state
+    :param summary: keep only the percentiles, skipping the summary statistics and the sample array
+    :param sample_dtype: data type of the returned samples, e.g. np.float32 to halve their memory
+    :param callback: called with the timing and memory record of each stage of the run as it finishes
+    :return: CleanupResult with the percentiles, samples, the volume of each isopach band, the volume grid and the
+    metrics of the run
+    """
+    if state is not None:
+        if tile_size is not None:
+            raise ValueError("state cannot be combined with tile_size")
+        if lean:
+            raise ValueError("state cannot be combined with lean, as it keeps the geometries between runs")
+        logger.info("Updating clean-up modelling for %s", name)
+        Band_volumes = state.update(isopach, osm_date=osm_date, use_cache=use_cache, overlay=overlay, pbf=pbf,
+                                    road_widths=road_widths)
+        if grid is not None:
+            Grid = isopach_grid_volumes(state.FP_area_UTM, state.road_UTM, isopach.to_crs(state.road_UTM.crs),
+                                        state.building_bands, state.road_bands, grid)
+    elif tile_size is not None or lean:
+        tile_size = tile_size or LEAN_TILE_SIZE
+        logger.info("Initiating clean-up modelling for %s in tiles of %s m", name, tile_size)
+        Band_volumes = tiled_isopach_band_volumes(isopach, tile_size, osm_date=osm_date, use_cache=use_cache,
+                                                  overlay=overlay, pbf=pbf, road_widths=road_widths, grid=grid)
+        Grid = Band_volumes.attrs.pop("grid", None)
+    else:
+        isopach_geom = _isopach_footprint(isopach)
+        FP_area_UTM, road_UTM = get_exposure(isopach_geom, osm_date=osm_date, use_cache=use_cache, pbf=pbf)
+        compute_surface_areas(FP_area_UTM, road_UTM, road_widths=road_widths)
+
+        # ---------- Cleanup model thresholds ----------
+        logger.info("Initiating clean-up modelling for %s", name)
+        isopach = isopach.to_crs(road_UTM.crs)
+        logger.info("Assigning buildings and roads to isopach bands")
+        building_bands, road_bands = get_isopach_band_assignment(exposure_cache_key(isopach_geom, osm_date=osm_date,
+                                                                                    pbf=pbf),
+                                                                 FP_area_UTM, road_UTM,
+                                                                 disjoint_isopach_bands(isopach), method=overlay)
+
+        if grid is not None:
+            Grid = isopach_grid_volumes(FP_area_UTM, road_UTM, isopach, building_bands, road_bands, grid)
+
+        # Clean-up thresholds
+        logger.info("Determining the appropriate clean-up threshold to use.")
+        Band_volumes = isopach_band_volumes(FP_area_UTM['area'], road_UTM['area'], isopach, building_bands,
+                                            road_bands)
+    logger.info("\n%s", Band_volumes)
+    cleanup_volume_min = Band_volumes['volume_min'].sum()
+    cleanup_volume_max = Band_volumes['volume_max'].sum()
+
+    # --- Monte Carlo analysis ---
+    Volume, Cost, Duration, Percentiles = _sample_cleanup_volume([cleanup_volume_min], [cleanup_volume_max], N, seed,
+                                                                 resources, sampling)
+
+    result = _report_cleanup_volume(name, name, Volume, fig, csv, cleanup_volume_max > 0, summary=summary,
+                                    sample_dtype=sample_dtype, breakdown=Band_volumes, Cost=Cost,
+                                    Duration=Duration, percentiles=Percentiles)
+    if grid is not None:
+        result.grid = Grid
+        if grid_path is not None and Grid is not None:
+            with _stage("grid_write") as record:
+                write_volume_grid(Grid, grid_path)
+                record["bytes_written"] = os.path.getsize(grid_path)
+    return result
+
+def tephra_cleanup_volume_batch (scenarios, csv=False, name="batch", N=10000, seed=None, use_cache=True,
+                                 osm_date=None, pbf=None, road_widths=None, impervious=False, resources=None,
+                                 errors="raise", fig=False, sampling="monte_carlo", callback=None):
+    """
+    This function will estimate the volume of tephra requiring removal for many thickness scenarios at once. The
+    surface areas of each place are obtained only once, and the clean-up thresholds and Monte Carlo sampling are
+    evaluated for all scenarios together.
+
+        Arguments:
+            scenarios (DataFrame): Table of scenarios with the columns "place", "min_thickness" and "max_thickness"
+            (thicknesses in mm). A list of (place, min_thickness, max_thickness) tuples is also accepted
+            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            name (str): Name used for the csv file
+            N (int): Number of Monte Carlo samples to draw for each scenario
+            seed (int): Seed for the random number generator so that results can be reproduced. Defaults to None
+            use_cache (Bool): Defines whether indexed and cached exposure data are used (True) or not (False)
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z") to model. None uses the latest data
+            pbf (str): Path to a local .osm.pbf extract to read exposure data from instead of querying Overpass.
+            Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM
+            highway, lanes and width tags (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            impervious (Bool): Defines whether the impervious area is obtained from OSM car parks and footpaths (True)
+            or set equal to the road area (False)
+            resources (dict): Distributions of the clean-up cost per cubic metre, truck size, disposal time, number of
+            trucks and working hours per day, see cleanup_cost_duration. When given, the 10th, 50th and 90th
+            percentile of the cost and duration (days) of clean-up are added for each scenario. Defaults to None
+            errors (str): "raise" stops the batch when the exposure data of a place cannot be obtained. "skip" logs
+            the error and leaves the results of the scenarios of that place empty (NaN)
+            fig (Bool): Defines whether the graph of each scenario is drawn to a multi-page PDF named
+            "<name>_volume.pdf" in RESULTS_DIR (True), or not (False). A FigureRenderer can be given to choose the
+            output instead. Graphs are drawn in a background thread from precomputed bins while the remaining
+            scenarios are sampled
+            sampling (str): "monte_carlo", "sobol" or "analytic", see sample_uniform_product. "analytic" gives the
+            exact percentiles of every scenario without drawing any samples unless resources or figures are requested
+            callback (function): Called with the timing and memory record of each stage of the run as it finishes.
+            Defaults to None
+        Returns:
+             CleanUpVolume (DataFrame): One row per scenario with the clean-up area range and the 10th, 50th and 90th
+             percentile of the volume of tephra requiring removal in cubic metres. The RunMetrics of the run are
+             stored in CleanUpVolume.attrs["metrics"]
+    """
+    metrics = RunMetrics(callback)
+    with _collect_metrics(metrics):
+        renderer = fig or None
+        if fig is True:
+            renderer = FigureRenderer(pdf=os.path.join(RESULTS_DIR, name + "_volume.pdf"))
+        try:
+            CleanUpVolume = _cleanup_volume_batch(scenarios, csv, name, N, seed, use_cache, osm_date, pbf,
+                                                  road_widths, impervious, resources, errors, renderer, sampling)
+        finally:
+            if fig is True:
+                renderer.close()
+    CleanUpVolume.attrs["metrics"] = metrics
+    return CleanUpVolume
+
+
+def _cleanup_volume_batch(scenarios, csv, name, N, seed, use_cache, osm_date, pbf, road_widths, impervious,
+                          resources, errors, renderer, sampling):
+    if not isinstance(scenarios, pd.DataFrame):
+        scenarios = pd.DataFrame(list(scenarios), columns=["place", "min_thickness", "max_thickness"])
+    scenarios = scenarios.reset_index(drop=True)
+    logger.info("Initiating tephra clean-up model for %s scenarios across %s places", len(scenarios),
+                scenarios["place"].nunique())
+
+    surface_areas = {}
+    for place in scenarios["place"].unique():
+        try:
+            surface_areas[place] = get_surface_areas(place, osm_date=osm_date, use_cache=use_cache, pbf=pbf,
+                                                     road_widths=road_widths, impervious=impervious)
+        except ExposureFetchError as error:
+            if errors != "skip":
+                raise
+            logger.error("Skipping %s: %s", place, error)
+            surface_areas[place] = (np.nan, np.nan, np.nan)
+    areas = np.array([surface_areas[place] for place in scenarios["place"]], dtype=float).reshape(-1, 3)
+    skipped = np.isnan(areas).any(axis=1)
+    areas[skipped] = 0
+    min_thickness = scenarios["min_thickness"].to_numpy(dtype=float)
+    max_thickness = scenarios["max_thickness"].to_numpy(dtype=float)
+
+    logger.info("Determining the appropriate clean-up threshold to use.")
+    with _stage("thresholds") as record:
+        cleanup_area_min, cleanup_area_max = cleanup_area_thresholds(areas[:, 0], areas[:, 1], areas[:, 2],
+                                                                     max_thickness)
+        record["features"] = len(scenarios)
+
+    logger.info("Calculating tephra volume requiring clean-up.")
+    with _stage("monte_carlo") as record:
+        rng = np.random.default_rng(seed)
+        outputs = 1 if resources is None else 3
+        percentiles = np.empty((len(scenarios), 3 * outputs))
+        chunk = max(1, int(10 ** 7 // max(int(N) * outputs, 1)))
+        if sampling == "analytic" and resources is None and renderer is None:
+            chunk = max(1, len(scenarios))
+        for start in range(0, len(scenarios), chunk):
+            stop = start + chunk
+            low = [cleanup_area_min[start:stop], min_thickness[start:stop] / 1000]
+            high = [cleanup_area_max[start:stop], max_thickness[start:stop] / 1000]
+            if sampling == "analytic":
+                percentiles[start:stop, :3] = uniform_product_quantile(low, high, [0.1, 0.5, 0.9])
+                if resources is None and renderer is None:
+                    continue
+            Samples = [sample_uniform_product(low, high, N=N, seed=rng, sampling=sampling)]
+            if resources is not None:
+                Samples.extend(cleanup_cost_duration(Samples[0], resources, seed=rng))
+            for i, Sample in enumerate(Samples[1:] if sampling == "analytic" else Samples,
+                                       start=1 if sampling == "analytic" else 0):
+                percentiles[start:stop, 3 * i:3 * i + 3] = np.percentile(Sample, [10, 50, 90], axis=1).T
+            if renderer is not None:
+                for row, Volume in zip(range(start, stop), Samples[0]):
+                    if not skipped[row] and Volume.any():
+                        renderer.submit("{}_{:g}-{:g}mm".format(_place_name_save(scenarios["place"][row]),
+                                                                min_thickness[row], max_thickness[row]),
+                                        volume_figure_data(Volume))
+        record["features"] = len(scenarios) * int(N)
+    percentiles[skipped] = np.nan
+    cleanup_area_min = np.where(skipped, np.nan, cleanup_area_min)
+    cleanup_area_max = np.where(skipped, np.nan, cleanup_area_max)
+
+    CleanUpVolume = pd.DataFrame({"Place": scenarios["place"],
+                                  "min_thickness": min_thickness,
+                                  "max_thickness": max_thickness,
+                                  "cleanup_area_min": cleanup_area_min,
+                                  "cleanup_area_max": cleanup_area_max,
+                                  "10th Percentile": percentiles[:, 0],
+                                  "50th Percentile": percentiles[:, 1],
+                                  "90th Percentile": percentiles[:, 2]})
+    if resources is not None:
+        for i, label in ((1, "Cost"), (2, "Duration")):
+            for j, q in enumerate((10, 50, 90)):
+                CleanUpVolume["{} {}th Percentile".format(label, q)] = percentiles[:, 3 * i + j]
+    logger.info("\n%s", CleanUpVolume)
+    if csv==True:
+        with _stage("report") as record:
+            path_csv = os.path.join(RESULTS_DIR, name + "_" + ".csv")
+            CleanUpVolume.to_csv(path_csv, index=False)
+            record["bytes_written"] = os.path.getsize(path_csv)
+    else:
+        logger.info("No csv will be produced because csv=False. If you want a csv, make csv=True")
+    return CleanUpVolume
+
+def _isopach_footprint(isopach):
+    isopach_geom = isopach.to_crs("EPSG:4326")
+    isopach_geom['dissolve'] = 1
+    isopach_geom = isopach_geom.dissolve(by='dissolve')
+    return isopach_geom["geometry"].iloc[0]
+
+
+def _task_query(task):
+    # The OSM query and buffer distance whose exposure data a clean-up task reads
+    if "isopach" in task:
+        return _isopach_footprint(task["isopach"]), None
+    elif "point" in task:
+        return task["point"], task["buffer"]
+    return task["place"], None
+
+
+def _prefetch_exposure(tasks, overpass_slots):
+    # Downloads the exposure data shared by tasks with the same query once, unless the surface areas of every task
+    # are already indexed. The data are projected by the first of the tasks to run in a worker process
+    task = tasks[0]
+    query, dist = _task_query(task)
+    use_cache = all(task.get("use_cache", True) for task in tasks)
+    if use_cache and "isopach" not in task and all(
+            lookup_surface_areas(query, dist=dist, osm_date=task.get("osm_date"), pbf=task.get("pbf"),
+                                 road_widths=task.get("road_widths"), impervious=task.get("impervious", False))
+            is not None for task in tasks):
+        return
+    download_exposure(query, dist=dist, osm_date=task.get("osm_date"), use_cache=use_cache, pbf=task.get("pbf"),
+                      impervious=any(task.get("impervious", False) for task in tasks), slots=overpass_slots)
+
+
+def isopach_band_tasks(name, isopach, **kwargs):
+    """
+    Splits an isopach into one task per isopach band so that the bands can be modelled in parallel with run_parallel.
+    Nested bands are first trimmed with disjoint_isopach_bands, so that each task only covers (and fetches) the area
+    where its band is the thickest, and the band volumes add up to the volume of the whole isopach. Bands covered
+    entirely by thicker bands are left out.
+
+        Arguments:
+            name (str): Name of the isopach. Each task is named "<name>_band_<i>"
+            isopach (GeoDataFrame): Isopach polygons with "min_thick" and "max_thick" columns
+            **kwargs: Further arguments passed to tephra_cleanup_volume_from_isopach (e.g. fig, csv, N)
+        Returns:
+             tasks (list): One dictionary of keyword arguments per isopach band
+    """
+    import geopandas as gpd
+
+    bands = disjoint_isopach_bands(isopach)
+    tasks = []
+    for i in range(len(isopach)):
+        if bands.iloc[i].is_empty:
+            continue
+        band = gpd.GeoDataFrame(isopach.iloc[[i]].drop(columns=isopach.geometry.name), geometry=[bands.iloc[i]],
+                                crs=isopach.crs)
+        task = {"name": name + "_band_" + str(i), "isopach": band, "fig": False, "csv": False}
+        task.update(kwargs)
+        tasks.append(task)
+    return tasks
+
+
+def run_parallel(function, tasks, max_workers=None, fetch_workers=4, overpass_slots=2, seed=None, errors="raise",
+                 on_result=None):
     """
-    return()
+    Runs one of the clean-up functions for many places, points or isopach bands in parallel. Exposure data are first
+    downloaded in a pool of threads, once for each distinct query and with the number of simultaneous requests to the
+    Overpass server bounded, and staged in the local cache without being projected. The clean-up modelling is then
+    run in a pool of processes. The first task of each query projects its data and stores them in the cache, and the
+    other tasks of that query start once it has finished, so that they read the cache instead of projecting again.
+    Isopach tasks with tile_size, state or lean obtain their own data in the worker processes.
+
+        Arguments:
+            function (function): tephra_cleanup_volume_from_place, _from_point or _from_isopach
+            tasks (list): One dictionary of keyword arguments for the function per run. Figures should be turned off
+            (fig=False) because they cannot be shown from worker processes
+            max_workers (int): Number of worker processes for the modelling. Defaults to the number of CPUs
+            fetch_workers (int): Number of threads used to obtain exposure data
+            overpass_slots (int): Maximum number of requests sent to the Overpass server at once, counting the
+            buildings, roads and impervious surfaces of a place as separate requests. Retries wait without holding
+            a slot
+            seed (int): Seed from which an independent, reproducible seed for every task is derived. Defaults to None
+            errors (str): "raise" stops the run when the exposure data of a task cannot be obtained. "skip" logs the
+            error, does not run that task (or stops it, if it obtains its data in a worker process) and returns the
+            ExposureFetchError in its place in the results
+            on_result (function): Called in the calling process with the position of each task and its result as soon
+            as the task finishes, e.g. to checkpoint long runs. Defaults to None
+        Returns:
+             results (list): Output of the function for each task, in the same order as the tasks
+    """
+    tasks = [dict(task) for task in tasks]
+    for task, task_seed in zip(tasks, np.random.SeedSequence(seed).spawn(len(tasks))):
+        task.setdefault("seed", task_seed)
+
+    queries = {}
+    for i, task in enumerate(tasks):
+        if task.get("tile_size") is None and task.get("state") is None and not task.get("lean"):
+            query, dist = _task_query(task)
+            key = exposure_cache_key(query, dist=dist, osm_date=task.get("osm_date"), pbf=task.get("pbf"))
+            queries.setdefault(key, []).append(i)
+
+    # Queries are downloaded in order of snapshot date, as only one osm_date can be fetched from Overpass at a time
+    queries = dict(sorted(queries.items(), key=lambda item: str(tasks[item[1][0]].get("osm_date"))))
+    logger.info("Obtaining exposure data for %s queries of %s tasks", len(queries), len(tasks))
+    slots = threading.BoundedSemaphore(overpass_slots)
+    failed = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+        futures = [(group, executor.submit(_prefetch_exposure, [tasks[i] for i in group], slots))
+                   for group in queries.values()]
+        for group, future in futures:
+            try:
+                future.result()
+            except ExposureFetchError as error:
+                if errors != "skip":
+                    raise
+                logger.error("Skipping tasks %s: %s", group, error)
+                failed.update((i, error) for i in group)
+
+    logger.info("Running clean-up model for %s tasks", len(tasks) - len(failed))
+    results = dict(failed)
+    followers = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+
+        def submit(i):
+            futures[executor.submit(function, **tasks[i])] = i
+        for group in queries.values():
+            if group[0] not in failed:
+                for i in group:
+                    tasks[i]["use_cache"] = True
+                followers[group[0]] = group[1:]
+                submit(group[0])
+        grouped = set(i for group in queries.values() for i in group)
+        for i in range(len(tasks)):
+            if i not in grouped:
+                submit(i)
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                try:
+                    results[i] = future.result()
+                except ExposureFetchError as error:
+                    # Tiled, lean and state tasks obtain their own data in the worker processes
+                    if errors != "skip":
+                        raise
+                    logger.error("Skipping task %s: %s", i, error)
+                    results[i] = error
+                if on_result is not None:
+                    on_result(i, results[i])
+                for follower in followers.pop(i, []):
+                    submit(follower)
+    return [results[i] for i in range(len(tasks))]
+
+def sample_raster_thickness(src, points, band=1):
+    """
+    Samples the tephra thickness at many points from an open raster. Points are grouped by the raster block they fall
+    in and each block is read once with a windowed read, so only one block of the raster is held in memory at a time.
+
+        Arguments:
+            src (DatasetReader): Raster of tephra thickness in mm opened with rasterio
+            points (GeoSeries): Points at which to sample the thickness
+            band (int): Raster band containing the thickness
+        Returns:
+             thickness (ndarray): Thickness in mm at each point. Points outside the raster or on nodata cells are 0
+    """
+    from rasterio.windows import Window
+
+    points = points.to_crs(src.crs)
+    cols, rows = ~src.transform * (points.x.to_numpy(), points.y.to_numpy())
+    rows = np.floor(rows).astype(np.int64)
+    cols = np.floor(cols).astype(np.int64)
+    thickness = np.zeros(len(points))
+    inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+
+    block_height, block_width = src.block_shapes[band - 1]
+    block_cols = -(-src.width // block_width)
+    block = (rows[inside] // block_height) * block_cols + cols[inside] // block_width
+    order = inside[np.argsort(block, kind="stable")]
+    blocks, starts = np.unique(np.sort(block, kind="stable"), return_index=True)
+    for start, stop in zip(starts, np.append(starts[1:], len(order))):
+        members = order[start:stop]
+        row_off = rows[members[0]] // block_height * block_height
+        col_off = cols[members[0]] // block_width * block_width
+        window = Window(col_off, row_off, min(block_width, src.width - col_off),
+                        min(block_height, src.height - row_off))
+        data = src.read(band, window=window, masked=True)
+        thickness[members] = data[rows[members] - row_off, cols[members] - col_off].filled(0)
+    return thickness
+
+
+def raster_cleanup_footprint(src, band=1, min_thickness=0.5, rows=1024):
+    """
+    Outlines the part of a raster of tephra thickness where clean-up may be needed, so that exposure data are only
+    obtained for that area rather than for the whole extent of the raster. The raster is read in strips of rows, so
+    only one strip is held in memory at a time.
+
+        Arguments:
+            src (DatasetReader): Raster of tephra thickness in mm opened with rasterio
+            band (int): Raster band containing the thickness
+            min_thickness (float): Thickness in mm from which clean-up is needed. Roads are cleaned from 0.5 mm
+            rows (int): Number of raster rows read at a time
+        Returns:
+             footprint (Polygon or MultiPolygon): Cells with at least min_thickness of tephra in WGS84, or None if
+             there are none
+    """
+    import geopandas as gpd
+    from rasterio.features import shapes
+    from rasterio.windows import Window, transform
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+
+    polygons = []
+    for row_off in range(0, src.height, rows):
+        window = Window(0, row_off, src.width, min(rows, src.height - row_off))
+        data = src.read(band, window=window, masked=True)
+        mask = (data.filled(0) >= min_thickness).astype(np.uint8)
+        if mask.any():
+            polygons.extend(shape(geometry) for geometry, value in shapes(mask, mask=mask.astype(bool),
+                                                                          transform=transform(window, src.transform)))
+    if not polygons:
+        return None
+    # Strips are merged and the outline simplified to within a cell, which keeps the Overpass query short
+    footprint = unary_union(polygons).simplify(min(abs(src.res[0]), abs(src.res[1])) / 2)
+    return gpd.GeoSeries([footprint], crs=src.crs).to_crs("EPSG:4326").iloc[0]
+
+
+@_instrumented
+def tephra_cleanup_volume_from_raster (area, raster, fig, csv, N=10000, seed=None, use_cache=True, osm_date=None,
+                                       band=1, pbf=None, summary=False, sample_dtype=None, road_widths=None,
+                                       resources=None, sampling="monte_carlo", tile_size=None):
+    """
+    This function will estimate the volume of tephra requiring removal across the extent of a raster of tephra
+    thickness, such as the output of a tephra dispersal model. Exposure data are only obtained where the raster has at
+    least 0.5 mm of tephra (see raster_cleanup_footprint). The thickness is sampled from the raster for every building
+    footprint and road segment, and the clean-up thresholds are applied to each feature.
+
+        Arguments:
+            area (str): Name of the area or scenario being modelled
+            raster (str): Path to a raster (e.g. GeoTIFF) of tephra thickness in mm
+            fig (Bool): Defines whether a graph is produced of the model results (True) or not (False). A
+            FigureRenderer draws and saves the graph off the modelling thread instead of showing it
+            csv (Bool): Defines whether a csv file is generated that contains the model results (True) or not (False)
+            N (int): Number of Monte Carlo samples to draw
+            seed (int): Seed for the random number generator so that results can be reproduced. Defaults to None
+            use_cache (Bool): Defines whether exposure data are loaded from the local cache when available (True) or
+            downloaded from OSM again (False)
+            osm_date (str): OSM snapshot date (e.g. "2020-12-01T00:00:00Z") to model. None uses the latest data
+            band (int): Raster band containing the tephra thickness
+            pbf (str): Path to a local .osm.pbf extract to read exposure data from instead of querying Overpass.
+            Defaults to None
+            road_widths (dict): Width in metres of each highway type used to estimate road widths from the OSM
+            highway, lanes and width tags (e.g. ROAD_WIDTHS). None gives every road a width of 3 m
+            resources (dict): Distributions of the clean-up cost per cubic metre, truck size, disposal time, number of
+            trucks and working hours per day, see cleanup_cost_duration. When given, the cost and duration of
+            clean-up are sampled with the volume. Defaults to None
+            sampling (str): "monte_carlo" draws N pseudo-random samples. "sobol" draws a scrambled Sobol sequence
+            (requires SciPy) for stable percentiles from far fewer samples. "analytic" calculates the exact
+            percentiles, see uniform_product_quantile. The convergence of sampled percentiles is reported in
+            result.convergence
+            summary (Bool): Defines whether only the percentiles are kept (True), skipping the summary statistics
+            and the sample array, or the Monte Carlo samples are returned too (False)
+            sample_dtype (dtype): Data type of the returned samples, e.g. np.float32 to halve their memory. Defaults
+            to float64
+            tile_size (float): Width in metres of the tiles used to obtain and process exposure data one tile at a
+            time, as for isopachs (see iter_isopach_tiles). None obtains the data for the whole area at once
+            callback (function): Called with the timing and memory record of each stage of the run as it finishes.
+            Defaults to None
+        Returns:
+             Result (CleanupResult): Percentiles, Monte Carlo samples and breakdown of the volume of tephra requiring
+             removal in cubic metres, the cost and duration of clean-up, and the metrics of each stage of the run
+    """
+    try:
+        import rasterio
+    except ImportError:
+        raise ImportError("rasterio is required to model clean-up volumes from a raster")
+
+    logger.info("Initiating tephra clean-up model for %s", area)
+    # Area and clean-up volume of the buildings and roads
+    areas = np.zeros(2)
+    volumes = np.zeros(2)
+    with rasterio.open(raster) as src:
+        with _stage("raster_footprint"):
+            footprint = raster_cleanup_footprint(src, band=band)
+        if footprint is None:
+            logger.info("No tephra requiring clean-up in the raster")
+            tiles = []
+        elif tile_size is None:
+            tiles = [(footprint, None, None)]
+        else:
+            logger.info("Initiating clean-up modelling for %s in tiles of %s m", area, tile_size)
+            tiles = iter_isopach_tiles(footprint, tile_size)
+        for tile, square, crs in tiles:
+            FP_area_UTM, road_UTM = get_exposure(tile, osm_date=osm_date, use_cache=use_cache,
+                                                 truncate_by_edge=square is not None, pbf=pbf)
+            if not len(FP_area_UTM) and not len(road_UTM):
+                logger.warning("No buildings or roads in the area at %s, it is given zero volume", tile.bounds)
+                continue
+            compute_surface_areas(FP_area_UTM, road_UTM, road_widths=road_widths)
+            if square is not None:
+                # Buildings and road segments crossing tile edges are counted in the tile containing them
+                FP_area_UTM = FP_area_UTM[_owned_by_tile(FP_area_UTM.geometry, square, crs)]
+                road_UTM = road_UTM[_owned_by_tile(road_UTM.geometry, square, crs)]
+
+            with _stage("raster_sampling") as record:
+                logger.info("Sampling tephra thickness from raster")
+                building_thickness = sample_raster_thickness(src, FP_area_UTM.geometry.representative_point(),
+                                                             band=band)
+                road_thickness = sample_raster_thickness(src, road_UTM.geometry.interpolate(0.5, normalized=True),
+                                                         band=band)
+                record["features"] = len(building_thickness) + len(road_thickness)
+
+            logger.info("Determining the appropriate clean-up threshold to use.")
+            with _stage("thresholds"):
+                building_volume, road_volume = feature_cleanup_volumes(FP_area_UTM['area'].to_numpy(),
+                                                                       building_thickness,
+                                                                       road_UTM['area'].to_numpy(), road_thickness)
+            areas += [FP_area_UTM['area'].sum(), road_UTM['area'].sum()]
+            volumes += [building_volume.sum(), road_volume.sum()]
+            del FP_area_UTM, road_UTM
+    cleanup_volume = volumes.sum()
+    cleanup_volume_min = cleanup_volume - (cleanup_volume * 0.1)
+    cleanup_volume_max = cleanup_volume + (cleanup_volume * 0.1)
+
+    # --- Monte Carlo analysis ---
+    Volume, Cost, Duration, Percentiles = _sample_cleanup_volume([cleanup_volume_min], [cleanup_volume_max], N, seed,
+                                                                 resources, sampling)
+
+    return _report_cleanup_volume(area, area, Volume, fig, csv, cleanup_volume_max > 0, summary=summary,
+                                  sample_dtype=sample_dtype, Cost=Cost, Duration=Duration, percentiles=Percentiles,
+                                  breakdown=pd.DataFrame({"area": areas, "volume": volumes},
+                                                         index=["buildings", "roads"]))
+
+# Original (misspelt) name of tephra_cleanup_volume_from_raster, kept so existing scripts continue to work
+tephra_cleanup_volume_from_raser = tephra_cleanup_volume_from_raster
 
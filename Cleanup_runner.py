@@ -0,0 +1,261 @@
+"""
+Runs the tephra clean-up model from the command line for every place, point and isopach of a job manifest.
+
+The manifest is a JSON file listing the places and points to model against each (min, max) thickness scenario, and
+the isopachs to model, together with the options passed to the clean-up functions:
+
+    {
+        "output": "Results/overnight.csv",
+        "seed": 42,
+        "scenarios": [[1, 5], [5, 20], [20, 100]],
+        "places": ["Rotorua, New Zealand", "Taupo, New Zealand"],
+        "points": [{"name": "Ohakune", "lat": -39.418, "lon": 175.399, "buffer": 3000}],
+        "isopachs": [{"name": "Ruapehu", "path": "Geospatial_data/Pretend_scenario/Pretend_Ruapehu_Eruption.shp"}],
+        "options": {"N": 10000, "sampling": "monte_carlo", "road_widths": "ROAD_WIDTHS"}
+    }
+
+Tasks run in a pool of worker processes (see run_parallel). Each finished task is appended to a checkpoint file
+next to the output, so an interrupted run picks up where it left off when started again with the same manifest. A run
+whose seed or options differ from those of the checkpoint is refused unless started with --restart, so that results
+of different settings are never mixed in one output.
+The results of all tasks are written to the output (csv or parquet) in one go once every task has finished:
+
+    python Cleanup_runner.py manifest.json --workers 8
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import Cleanup_functions as cf
+
+logger = logging.getLogger("Cleanup_runner")
+# Arguments set by the runner for every task, which cannot be given as manifest options
+RUNNER_OPTIONS = ("fig", "csv", "summary", "seed")
+
+
+def load_manifest(path):
+    """
+    Reads a job manifest and resolves paths relative to the manifest.
+
+        Arguments:
+            path (str): Path of the JSON manifest
+        Returns:
+             manifest (dict): Manifest with "output", "seed", "scenarios", "places", "points", "isopachs" and
+             "options" entries
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    manifest.setdefault("output", os.path.splitext(path)[0] + "_results.csv")
+    manifest["output"] = os.path.join(root, manifest["output"])
+    for key in ("scenarios", "places", "points", "isopachs"):
+        manifest.setdefault(key, [])
+    for isopach in manifest["isopachs"]:
+        isopach["path"] = os.path.join(root, isopach["path"])
+    manifest.setdefault("options", {})
+    reserved = sorted(set(manifest["options"]) & set(RUNNER_OPTIONS))
+    if reserved:
+        raise ValueError("The options {} are set by the runner and cannot be given in the manifest. The seed is set "
+                         "with the top-level \"seed\" entry".format(", ".join(reserved)))
+    if manifest["options"].get("pbf"):
+        manifest["options"]["pbf"] = os.path.join(root, manifest["options"]["pbf"])
+    if isinstance(manifest["options"].get("road_widths"), str):
+        # Tables of road widths defined in Cleanup_functions can be named, e.g. "ROAD_WIDTHS"
+        manifest["options"]["road_widths"] = getattr(cf, manifest["options"]["road_widths"])
+    return manifest
+
+
+def manifest_tasks(manifest):
+    """
+    Expands a manifest into one task per place or point and thickness scenario, and one task per isopach.
+
+        Arguments:
+            manifest (dict): Manifest from load_manifest
+        Returns:
+             tasks (list): (task_id, function, kwargs) of every task. Task ids are stable, so that completed tasks can
+             be recognised when a run is resumed
+    """
+    tasks = []
+    for place in manifest["places"]:
+        for min_thickness, max_thickness in manifest["scenarios"]:
+            tasks.append(("place:{}:{:g}-{:g}".format(place, min_thickness, max_thickness),
+                          cf.tephra_cleanup_volume_from_place,
+                          {"place": place, "min_thickness": min_thickness, "max_thickness": max_thickness}))
+    for point in manifest["points"]:
+        for min_thickness, max_thickness in manifest["scenarios"]:
+            tasks.append(("point:{}:{:g}-{:g}".format(point["name"], min_thickness, max_thickness),
+                          cf.tephra_cleanup_volume_from_point,
+                          {"point": (point["lat"], point["lon"]), "buffer": point["buffer"], "place": point["name"],
+                           "min_thickness": min_thickness, "max_thickness": max_thickness}))
+    for isopach in manifest["isopachs"]:
+        tasks.append(("isopach:{}".format(isopach["name"]), cf.tephra_cleanup_volume_from_isopach,
+                      {"name": isopach["name"], "path": isopach["path"]}))
+
+    # Seeds are derived from the position of each task in the full manifest, so resumed runs reproduce them
+    seeds = np.random.SeedSequence(manifest.get("seed")).spawn(len(tasks))
+    for (task_id, function, kwargs), seed in zip(tasks, seeds):
+        # Options only apply to the functions accepting them, e.g. impervious is not used for isopachs. The arguments
+        # of each task take precedence over the options
+        parameters = inspect.signature(function).parameters
+        options = {key: value for key, value in manifest["options"].items() if key in parameters}
+        kwargs.update({key: value for key, value in options.items() if key not in kwargs})
+        kwargs.update({"fig": False, "csv": False, "summary": True, "seed": seed})
+    return tasks
+
+
+def manifest_fingerprint(manifest):
+    """
+    Hashes the seed and options of a manifest, which determine the results of every task.
+
+        Arguments:
+            manifest (dict): Manifest from load_manifest
+        Returns:
+             fingerprint (str): SHA-1 hex digest of the seed and options
+    """
+    settings = json.dumps({"seed": manifest.get("seed"), "options": manifest["options"]}, sort_keys=True,
+                          default=str)
+    return hashlib.sha1(settings.encode("UTF-8")).hexdigest()
+
+
+def checkpoint_path(output):
+    return output + ".checkpoint.jsonl"
+
+
+def read_checkpoint(path):
+    """
+    Reads the results of the tasks completed by previous runs.
+
+        Arguments:
+            path (str): Path of the checkpoint file
+        Returns:
+             (rows, fingerprint) (tuple): Result row of every completed task, keyed on its task id, and the
+             manifest_fingerprint the checkpoint was written with (None if there is no checkpoint)
+    """
+    rows = {}
+    fingerprint = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # A run interrupted while writing leaves a partial last line, which is run again
+                    continue
+                if "fingerprint" in row:
+                    fingerprint = row["fingerprint"]
+                else:
+                    rows[row["task"]] = row
+    return rows, fingerprint
+
+
+def result_row(task_id, kwargs, result):
+    row = {"task": task_id, "kind": task_id.split(":")[0], "min_thickness": kwargs.get("min_thickness"),
+           "max_thickness": kwargs.get("max_thickness")}
+    row.update({key: float(value) if isinstance(value, np.floating) else value
+                for key, value in result.to_frame().iloc[0].items()})
+    # Peak memory of the task on Linux. Elsewhere it is the peak of the worker process so far (see RunMetrics)
+    row["peak_rss"] = result.metrics.peak_rss if result.metrics is not None else None
+    return row
+
+
+def run_manifest(manifest, max_workers=None, fetch_workers=4, overpass_slots=2, restart=False):
+    """
+    Runs every task of a manifest that has not been completed yet, checkpointing each task as it finishes, and
+    writes the results of all tasks to the output in one go.
+
+        Arguments:
+            manifest (dict): Manifest from load_manifest
+            max_workers (int): Number of worker processes. Defaults to the number of CPUs
+            fetch_workers (int): Number of threads used to obtain exposure data
+            overpass_slots (int): Maximum number of requests sent to the Overpass server at once
+            restart (Bool): Defines whether completed tasks are run again (True) or skipped (False). Raises ValueError
+            when a checkpoint written with a different seed or options exists and restart is False
+        Returns:
+             Results (DataFrame): One row per completed task. Tasks whose exposure data could not be obtained are
+             left out and run again next time
+    """
+    output = manifest["output"]
+    checkpoint = checkpoint_path(output)
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    rows, fingerprint = read_checkpoint(checkpoint)
+    if os.path.exists(checkpoint) and fingerprint != manifest_fingerprint(manifest):
+        raise ValueError("{} was written with a different seed or different options. Start with --restart to run "
+                         "every task again with the new settings".format(checkpoint))
+    tasks = [task for task in manifest_tasks(manifest) if task[0] not in rows]
+    logger.info("%s tasks completed previously, %s to run", len(rows), len(tasks))
+
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(checkpoint, "a") as f:
+        if fingerprint is None:
+            f.write(json.dumps({"fingerprint": manifest_fingerprint(manifest)}) + "\n")
+            f.flush()
+
+        def on_result(i, result, group=None):
+            if isinstance(result, cf.ExposureFetchError):
+                return
+            task_id, function, kwargs = group[i]
+            rows[task_id] = result_row(task_id, kwargs, result)
+            f.write(json.dumps(rows[task_id]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        for function in (cf.tephra_cleanup_volume_from_place, cf.tephra_cleanup_volume_from_point,
+                         cf.tephra_cleanup_volume_from_isopach):
+            group = [task for task in tasks if task[1] is function]
+            if not group:
+                continue
+            kwargs = [dict(task[2]) for task in group]
+            if function is cf.tephra_cleanup_volume_from_isopach:
+                import geopandas as gpd
+
+                for task in kwargs:
+                    task["isopach"] = gpd.read_file(task.pop("path"))
+            cf.run_parallel(function, kwargs, max_workers=max_workers, fetch_workers=fetch_workers,
+                            overpass_slots=overpass_slots, errors="skip",
+                            on_result=lambda i, result, group=group: on_result(i, result, group))
+
+    order = {task[0]: i for i, task in enumerate(manifest_tasks(manifest))}
+    Results = pd.DataFrame(sorted(rows.values(), key=lambda row: order.get(row["task"], len(order))))
+    if output.endswith(".parquet"):
+        Results.to_parquet(output, index=False)
+    else:
+        Results.to_csv(output, index=False)
+    failed = len(order) - len(rows)
+    if failed:
+        logger.warning("%s tasks could not be run, start the runner again to retry them", failed)
+    logger.info("Results of %s tasks written to %s", len(Results), output)
+    return Results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the tephra clean-up model for every task of a job manifest")
+    parser.add_argument("manifest", help="JSON manifest of places, points, isopachs and thickness scenarios")
+    parser.add_argument("--workers", type=int, help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--fetch-workers", type=int, default=4, help="number of threads obtaining OSM data")
+    parser.add_argument("--overpass-slots", type=int, default=2,
+                        help="maximum number of requests sent to the Overpass server at once")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and run every task again")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        manifest = load_manifest(args.manifest)
+        Results = run_manifest(manifest, max_workers=args.workers, fetch_workers=args.fetch_workers,
+                               overpass_slots=args.overpass_slots, restart=args.restart)
+    except ValueError as error:
+        logger.error("%s", error)
+        return 2
+    return 0 if len(Results) == len(manifest_tasks(manifest)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
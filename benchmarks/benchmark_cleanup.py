@@ -0,0 +1,172 @@
+"""
+Benchmarks the stages of the tephra clean-up pipeline on synthetic cities, fully offline.
+
+Synthetic building footprints, road segments and isopachs are generated at controlled scales and served through the
+local extract (pbf) backend of Cleanup_functions, so no OSM data are downloaded. The isopach and place clean-up
+functions are run end to end without the exposure cache, and the time of each stage is read from the RunMetrics of
+their results, so that regressions anywhere in the pipeline can be caught and scaling curves compared between
+releases:
+
+    python benchmarks/benchmark_cleanup.py --scales 1000 10000 100000 --output results.csv
+    python benchmarks/benchmark_cleanup.py --scales 1000 10000 100000 --compare results.csv
+
+Each scale is run several times (--repeats) and the fastest time of each stage is kept, and stages faster than
+--min-time are not reported as regressions, so that the noise of millisecond stages does not fail a comparison.
+
+Generating the synthetic layers uses the vectorised geometry constructors of Shapely 2.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Cleanup_functions as cf
+
+CENTRE = (176.235119, -38.141111)
+PIPELINES = ["isopach", "place"]
+# Stages recorded in RunMetrics, in pipeline order. Stages not listed here are added after them
+STAGES = ["fetch", "projection", "buildings_write", "roads_write", "surface_areas", "thresholds", "overlay",
+          "band_volumes", "monte_carlo", "report"]
+
+
+def synthetic_city(n_features, seed=0):
+    """
+    Generates a square synthetic city with n_features buildings and n_features road segments.
+
+        Arguments:
+            n_features (int): Number of buildings and of road segments
+            seed (int): Seed for the random number generator
+        Returns:
+             (buildings, roads, extent) (tuple): Buildings and roads (with a "length" column) in WGS84 and the extent
+             of the city in degrees
+    """
+    rng = np.random.default_rng(seed)
+    # Roughly 100 features per hectare, as in a dense suburb
+    extent = np.sqrt(n_features / 100) * 100 / 111000
+    x = CENTRE[0] + rng.uniform(-extent / 2, extent / 2, n_features)
+    y = CENTRE[1] + rng.uniform(-extent / 2, extent / 2, n_features)
+    size = rng.uniform(5, 20, n_features) / 111000
+    buildings = gpd.GeoDataFrame(geometry=shapely.box(x, y, x + size, y + size), crs="EPSG:4326")
+    length = rng.uniform(20, 200, n_features)
+    coords = np.stack([np.stack([x, y], axis=1), np.stack([x + length / 111000, y], axis=1)], axis=1)
+    roads = gpd.GeoDataFrame({"length": length}, geometry=shapely.linestrings(coords), crs="EPSG:4326")
+    return buildings, roads, extent
+
+
+def synthetic_isopach(extent, n_bands=4):
+    """
+    Generates concentric isopach rings centred on the synthetic city, from 1-5 mm on the outside to >1000 mm.
+    """
+    thicknesses = [(1, 5), (5, 20), (20, 300), (1000, 2000)][:n_bands]
+    radii = np.linspace(extent * 0.75, extent * 0.1, n_bands)
+    centre = shapely.Point(CENTRE)
+    return gpd.GeoDataFrame({"min_thick": [t[0] for t in thicknesses], "max_thick": [t[1] for t in thicknesses]},
+                            geometry=[centre.buffer(r) for r in radii], crs="EPSG:4326")
+
+
+def benchmark(n_features, samples, stub_dir):
+    """
+    Runs the isopach and place clean-up functions end to end for one scale, without the exposure cache, and reads the
+    time of each stage from the metrics of the results.
+
+        Returns:
+             timings (list): One dict per pipeline with the wall time in seconds of each stage, the total and the peak
+             resident memory in bytes
+    """
+    buildings, roads, extent = synthetic_city(n_features)
+    isopach = synthetic_isopach(extent)
+    stub = os.path.join(stub_dir, "synthetic_" + str(n_features) + ".osm.pbf")
+    open(stub, "w").close()
+    boundary = gpd.GeoDataFrame({"name": ["Synthetic"], "admin_level": ["8"]},
+                                geometry=[cf._isopach_footprint(isopach)], crs="EPSG:4326")
+    cf._pbf_layers[os.path.abspath(stub)] = (buildings, roads, boundary)
+    results = {
+        "isopach": cf.tephra_cleanup_volume_from_isopach("Synthetic", isopach, False, True, N=samples, seed=0,
+                                                         use_cache=False, pbf=stub),
+        "place": cf.tephra_cleanup_volume_from_place("Synthetic", 5, 20, False, True, N=samples, seed=0,
+                                                     use_cache=False, pbf=stub)}
+    del cf._pbf_layers[os.path.abspath(stub)]
+    timings = []
+    for pipeline, result in results.items():
+        stages = result.metrics.to_frame().groupby("stage", sort=False)["wall_time"].sum()
+        timings.append({"pipeline": pipeline, "features": n_features, **stages.to_dict(),
+                        "total": result.metrics.wall_time, "peak_rss": result.metrics.peak_rss})
+    return timings
+
+
+def fastest(timings):
+    """
+    Keeps the fastest time of each stage (and the highest peak memory) over repeated runs of the same scale.
+    """
+    timings = pd.DataFrame(timings)
+    aggregation = {column: "max" if column == "peak_rss" else "min"
+                   for column in timings.columns.drop(["pipeline", "features"])}
+    return timings.groupby(["pipeline", "features"], sort=False).agg(aggregation).reset_index().to_dict("records")
+
+
+def compare(results, previous, tolerance, min_time=0.05):
+    """
+    Compares the stage timings with a previous run and returns the stages that slowed down by more than tolerance.
+    Stages taking less than min_time seconds are too short to time reliably and are ignored.
+    """
+    merged = results.merge(previous, on=["pipeline", "features"], suffixes=("", "_previous"))
+    regressions = []
+    for stage in results.columns.drop(["pipeline", "features", "peak_rss"]):
+        if stage + "_previous" not in merged:
+            continue
+        ratio = merged[stage] / merged[stage + "_previous"]
+        for pipeline, features, value, current in zip(merged["pipeline"], merged["features"], ratio, merged[stage]):
+            if value > 1 + tolerance and current >= min_time:
+                regressions.append((pipeline, features, stage, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tephra clean-up pipeline on synthetic cities")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of buildings (and of road segments) to benchmark, e.g. 1000 to 10000000")
+    parser.add_argument("--samples", type=int, default=10 ** 6, help="number of Monte Carlo samples")
+    parser.add_argument("--output", help="csv file to write the timings to")
+    parser.add_argument("--compare", help="csv file of a previous run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slow-down relative to the previous run before a stage is reported")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="number of runs of each scale, of which the fastest time of each stage is kept")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="stages faster than this many seconds are not reported as regressions")
+    args = parser.parse_args(argv)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as stub_dir:
+        # The cache, surface area index and csv outputs of the runs are kept in the temporary directory
+        cf.EXPOSURE_CACHE_DIR = os.path.join(stub_dir, "cache")
+        cf.SURFACE_AREA_INDEX = os.path.join(stub_dir, "surface_areas.sqlite")
+        cf.RESULTS_DIR = stub_dir
+        os.makedirs(os.path.join(stub_dir, "temp"))
+        for n_features in args.scales:
+            rows.extend(fastest([timing for _ in range(args.repeats)
+                                 for timing in benchmark(n_features, args.samples, stub_dir)]))
+            print(pd.DataFrame(rows[-len(PIPELINES):]).to_string(index=False, float_format="%.3f"))
+    results = pd.DataFrame(rows)
+    stages = [stage for stage in STAGES if stage in results] + [
+        stage for stage in results.columns if stage not in STAGES + ["pipeline", "features", "total", "peak_rss"]]
+    results = results[["pipeline", "features"] + stages + ["total", "peak_rss"]]
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.compare:
+        regressions = compare(results, pd.read_csv(args.compare), args.tolerance, args.min_time)
+        for pipeline, features, stage, ratio in regressions:
+            print("Regression:", pipeline, stage, "at", features, "features is", round(ratio, 2), "times slower")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Measures the time taken to import Cleanup_functions and checks it against a startup budget.
+
+Worker processes and serverless functions import Cleanup_functions once per start, so the module only imports numpy
+and pandas up front. OSMnX, GeoPandas, Matplotlib and requests are imported on the paths that need them. Each import
+is timed in a fresh interpreter, and the benchmark fails if the median import time exceeds the budget or if any of the
+lazily imported packages is loaded by the import:
+
+    python benchmarks/benchmark_import.py --budget 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ["osmnx", "geopandas", "matplotlib", "scipy", "requests", "rasterio", "pyrosm"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT = ("import json, sys, time\n"
+          "start = time.perf_counter()\n"
+          "import Cleanup_functions\n"
+          "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))\n")
+
+
+def time_import():
+    """
+    Imports Cleanup_functions in a fresh interpreter.
+
+        Returns:
+             (import_time, modules) (tuple): Import time in seconds and the names of the modules loaded
+    """
+    output = subprocess.run([sys.executable, "-c", IMPORT], cwd=ROOT, check=True, capture_output=True, text=True)
+    import_time, modules = json.loads(output.stdout.splitlines()[-1])
+    return import_time, set(modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the import time of Cleanup_functions")
+    parser.add_argument("--budget", type=float, default=1.0, help="maximum median import time in seconds")
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters to time")
+    args = parser.parse_args(argv)
+
+    times = []
+    loaded = set()
+    for i in range(args.repeat):
+        import_time, modules = time_import()
+        times.append(import_time)
+        loaded.update(module for module in LAZY_MODULES if module in modules)
+    median = statistics.median(times)
+    print("Import time: median", round(median, 3), "s, min", round(min(times), 3), "s, max", round(max(times), 3),
+          "s, budget", args.budget, "s")
+
+    failed = False
+    if median > args.budget:
+        print("Over budget: importing Cleanup_functions took", round(median, 3), "s")
+        failed = True
+    for module in sorted(loaded):
+        print("Eager import:", module, "is loaded by importing Cleanup_functions")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())